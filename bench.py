@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+from day2 import Program
+from day2 import OPERATIONS
+from day11 import hull_painting
+from day13 import run_game
+
+INPUTS = os.path.join(os.path.dirname(__file__), 'test', 'inputs')
+# Results and instruction counts are portable, the wall times stored along
+# them are those of the machine that saved the baseline
+BASELINE = os.path.join(os.path.dirname(__file__), 'bench_baseline.json')
+
+# Wall times are averaged over as many runs as fit in MIN_TIME seconds
+MIN_TIME = 0.1
+
+# Interpreter tiers, each one configures a freshly loaded program
+TIERS = {
+  'interpreter': lambda program: None,
+  'jit': lambda program: setattr(program, 'jit', True),
+}
+
+
+def load(day, configure):
+  with open(os.path.join(INPUTS, day)) as inp:
+    program = Program(inp.read())
+  configure(program)
+  return program
+
+
+def run_day2(configure):
+  program = load('day2', configure)
+  program.code[1] = 12
+  program.code[2] = 2
+  program.run()
+  return program.code[0]
+
+
+def run_day5(configure):
+  return load('day5', configure).run(5)[-1]
+
+
+def run_day7(configure):
+  amplifiers = [load('day7', configure) for phase in range(5, 10)]
+  for amplifier, phase in zip(amplifiers, range(5, 10)):
+    amplifier.inputs.append(phase)
+  signal = 0
+  while not amplifiers[-1].halted:
+    for amplifier in amplifiers:
+      signal = amplifier.run(signal)[-1]
+  return signal
+
+
+def run_day9(configure):
+  return load('day9', configure).run(2)[-1]
+
+
+def run_day11(configure):
+  (panels, x, y) = hull_painting(load('day11', configure), 1)
+  return len(panels)
+
+
+def run_day13(configure):
+  screen = {}
+  with contextlib.redirect_stdout(open(os.devnull, 'w')):
+    run_game(load('day13', configure), screen)
+  return screen[(-1,0)]
+
+
+def run_day15(configure, steps=5000):
+  # walk the maze keeping the left hand on the wall
+  program = load('day15', configure)
+  # N, E, S, W as droid movement commands
+  commands = [1, 4, 2, 3]
+  heading = 0
+  for step in range(steps):
+    for turn in (-1, 0, 1, 2):
+      direction = (heading + turn) % 4
+      (status,) = program.run(commands[direction])
+      if status != 0:
+        heading = direction
+        break
+  return heading
+
+
+def run_day17(configure):
+  return sum(load('day17', configure).run())
+
+
+WORKLOADS = {
+  'day2': run_day2,
+  'day5': run_day5,
+  'day7': run_day7,
+  'day9': run_day9,
+  'day11': run_day11,
+  'day13': run_day13,
+  'day15': run_day15,
+  'day17': run_day17,
+}
+
+
+def profile_workload(workload, tier):
+  ''' Count executed opcodes and peak memory, in a traced run of its own '''
+  counts = Counter()
+
+  def count(program, instruction, param_modes):
+    counts[instruction % 100] += 1
+
+  def configure(program):
+    TIERS[tier](program)
+    # tracing runs the plain interpreter loop, counts are the same for all tiers
+    program.trace = count
+
+  tracemalloc.start()
+  try:
+    result = workload(configure)
+    (_, peak) = tracemalloc.get_traced_memory()
+  finally:
+    tracemalloc.stop()
+  return (result, counts, peak)
+
+
+def time_workload(workload, tier, repeat):
+  best = None
+  for i in range(repeat):
+    runs = 0
+    start = time.perf_counter()
+    while True:
+      result = workload(TIERS[tier])
+      runs += 1
+      elapsed = time.perf_counter() - start
+      if elapsed >= MIN_TIME:
+        break
+    if best is None or elapsed / runs < best:
+      best = elapsed / runs
+  return (result, best)
+
+
+def bench(names, tier, repeat):
+  results = {}
+  for name in names:
+    workload = WORKLOADS[name]
+    (result, counts, peak) = profile_workload(workload, tier)
+    (timed_result, wall) = time_workload(workload, tier, repeat)
+    if timed_result != result:
+      logging.error(f"{name}: traced run gave {result}, timed run {timed_result}")
+    instructions = sum(counts.values())
+    results[name] = {
+      'result': result,
+      'instructions': instructions,
+      'wall': wall,
+      'ips': instructions / wall if wall else 0,
+      'peak_memory': peak,
+      'opcodes': {OPERATIONS[op][2]: n for op, n in sorted(counts.items())},
+    }
+  return results
+
+
+def compare(results, baseline, threshold=None):
+  ''' Returns the names of workloads that regressed against the baseline.
+  Wall times only count with a threshold, they are only comparable with a
+  baseline saved on the same machine '''
+  regressions = []
+  for name, current in results.items():
+    previous = baseline.get(name)
+    if previous is None:
+      continue
+    if (current['result'] != previous['result'] or
+        current['instructions'] != previous['instructions']):
+      logging.error(f"{name}: result or instruction count changed from baseline")
+      regressions.append(name)
+    elif threshold is not None and current['wall'] > previous['wall'] * (1 + threshold):
+      logging.error(f"{name}: {current['wall']:.3f}s vs baseline {previous['wall']:.3f}s")
+      regressions.append(name)
+  return regressions
+
+
+def report(results, baseline):
+  print(f"{'workload':<8} {'instructions':>12} {'wall(s)':>9} {'base(s)':>9} "
+        f"{'ips':>11} {'peak(KiB)':>10}")
+  for name, r in results.items():
+    base = baseline.get(name, {}).get('wall')
+    base = f"{base:9.3f}" if base is not None else f"{'-':>9}"
+    print(f"{name:<8} {r['instructions']:>12} {r['wall']:>9.3f} {base} "
+          f"{r['ips']:>11.0f} {r['peak_memory']/1024:>10.1f}")
+    print(f"{'':<8} " + ' '.join(f"{op}={n}" for op, n in r['opcodes'].items()))
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Intcode interpreter benchmarks')
+  parser.add_argument('workloads', nargs='*', help='defaults to all of them')
+  parser.add_argument('--tier', default='interpreter', choices=list(TIERS))
+  parser.add_argument('--repeat', type=int, default=5)
+  parser.add_argument('--baseline', default=BASELINE)
+  parser.add_argument('--save-baseline', action='store_true')
+  parser.add_argument('--threshold', type=float, default=None,
+                      help='also fail on a slowdown past this fraction, only '
+                           'meaningful against a baseline saved on this machine')
+  args = parser.parse_args()
+  unknown = set(args.workloads) - set(WORKLOADS)
+  if unknown:
+    parser.error(f"unknown workloads {sorted(unknown)}, pick from {list(WORKLOADS)}")
+  logging.basicConfig(level=logging.WARNING)
+
+  stored = {}
+  if os.path.exists(args.baseline):
+    with open(args.baseline) as f:
+      stored = json.load(f)
+  baseline = stored.get(args.tier, {})
+
+  results = bench(args.workloads or list(WORKLOADS), args.tier, args.repeat)
+  report(results, baseline)
+
+  if args.save_baseline:
+    stored.setdefault(args.tier, {}).update(results)
+    with open(args.baseline, 'w') as f:
+      json.dump(stored, f, indent=2, sort_keys=True)
+    return 0
+
+  return 1 if compare(results, baseline, args.threshold) else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -2,14 +2,10 @@
 import logging
 import fileinput
 import sys
-import re
-from io import StringIO
-from collections import defaultdict
 from collections import namedtuple
-from pprint import pprint
 
-from day2 import standalone
 from day2 import Program
+from grid import SparseGrid
 
 Loc = namedtuple('Location', ['x','y'])
 UP = 0
@@ -30,78 +26,50 @@ def main():
     render = render_panels(panels_painted, xsize, ysize)
 
 
-def render_panels(panels, x, y):
-  render = [0]*(y*2+1)
-  for r in range(len(render)):
-    render[r] = [0]*(x*2+1)
+def render_panels(panels, x=None, y=None):
+  # centered on the starting panel when sizes are given, otherwise just
+  # the painted area
+  window = None
+  if x is not None:
+    window = (-x, -y, x-1, y)
+  render = panels.render(' #', window, y_up=True) + '\n'
 
-  for loc, color in panels.items():
-    render[y+loc.y][x+loc.x] = color
-
-  out = StringIO()
-  for i in range(y*2,-1,-1):
-    for j in range(x*2):
-      color = render[i][j]
-      out.write(f'{color}'.replace('0',' ').replace('1','#'))
-    out.write('\n')
-
-  out.seek(0)
   if sys.stdout.isatty():
-    print(out.read())
-    out.seek(0)
+    print(render)
 
-  return out.read()
+  return render
 
 
 def hull_painting(program, starting_color = 0):
 
-  program.rewind_output = False
-
-  panels_painted = {}
+  panels_painted = SparseGrid()
   current_panel = Loc(0,0)
 
   panels_painted[current_panel] = starting_color
   current_direction = UP
 
-  # store sizes for rendering
-  largest_x = 0
-  largest_y = 0
-  smallest_x = 0
-  smallest_y = 0
+  robot = program.records(2)
+  camera = None
   while True:
-    # all panels black(0) by default
-    camera = panels_painted.get(current_panel, 0)
-    out = StringIO()
-    inp = f"{camera}"
-
-    # Run intcode, it'll suspend on input
-    standalone(program, inp, out)
-
-    output = out.read().rstrip().split("\n")
-    if output[0]:
-      (color,) = re.search('(\d+)', output[0]).groups()
-      color = int(color)
-      (turn,) = re.search('(\d+)', output[1]).groups()
-      turn = int(turn)
-      
-      panels_painted[current_panel] = color
-      logging.debug(f"Painted {current_panel} {COLORS[color]}")
-      (current_panel, current_direction) = get_movement(current_panel, current_direction, turn)
-      curr_x = current_panel.x
-      curr_y = current_panel.y
-      if curr_x > largest_x:
-        largest_x = curr_x
-      if curr_y > largest_y:
-        largest_y = curr_y
-      if curr_x < smallest_x:
-        smallest_x = curr_x
-      if curr_y < smallest_y:
-        smallest_y = curr_y
-      logging.debug(f"Turned {DIRECTIONS[current_direction]}")
-    else:
+    try:
+      record = robot.send(camera)
+    except StopIteration:
       # halted
       break
+    camera = None
+    if record is None:
+      # all panels black(0) by default
+      camera = panels_painted[current_panel]
+      continue
+
+    (color, turn) = record
+    panels_painted[current_panel] = color
+    logging.debug(f"Painted {current_panel} {COLORS[color]}")
+    (current_panel, current_direction) = get_movement(current_panel, current_direction, turn)
+    logging.debug(f"Turned {DIRECTIONS[current_direction]}")
 
+  # store sizes for rendering
+  (smallest_x, smallest_y, largest_x, largest_y) = panels_painted.bounds
   map_x = largest_x + abs(smallest_x)
   map_y = largest_y + abs(smallest_y)
   return (panels_painted, map_x, map_y)
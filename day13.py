@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
 import logging
 import fileinput
+import random
 import sys
+import time
 from io import StringIO
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 
-from day2 import Program, standalone
+from day2 import Program
+from day2 import intcode
 
 TILE_EMPTY = 0
 TILE_WALL = 1
@@ -13,15 +18,24 @@ TILE_HPADDLE = 3
 TILE_BALL = 4
 TILE_NAMES = [' ','%','#','=','o']
 
+# What a joystick policy sees before each move
+GameState = namedtuple('GameState', ['screen', 'pad', 'ball', 'score', 'frame'])
+PolicyResult = namedtuple('PolicyResult', ['score', 'blocks', 'steps', 'wall'])
+
 def main():
   logging.basicConfig(level=logging.ERROR)
   for line in fileinput.input():
     program = Program(line, rw=0)
+    program.jit = True
     #screen = init_game(program)
     #block_tiles = count_tiles(screen, TILE_BLOCK)
     #logging.info(f"{block_tiles=}")
+    if not sys.stdout.isatty():
+      (score, blocks) = auto_play(program)
+      print(f"{score=} {blocks=}")
+      continue
     screen = {}
-    run_game(program, screen)
+    run_game(program, screen, Renderer())
 
 def count_tiles(tiles, tileid):
   counter = 0
@@ -30,60 +44,209 @@ def count_tiles(tiles, tileid):
       counter += 1
   return counter
 
+def screen_size(screen):
+  xsize = max((x for (x, y) in screen if x >= 0), default=-1) + 1
+  ysize = max((y for (x, y) in screen if x >= 0), default=-1) + 1
+  return (xsize, ysize)
+
 def render_game(screen):
+  ''' Whole frame as text, sized to the tiles drawn so far '''
   out = StringIO()
   score = screen.get((-1,0), '-1')
-  for y in range(21):
-    for x in range(36):
-      tileid = screen[(x,y)]
+  (xsize, ysize) = screen_size(screen)
+  for y in range(ysize):
+    for x in range(xsize):
+      tileid = screen.get((x,y), TILE_EMPTY)
       out.write(f"{TILE_NAMES[tileid]}")
     out.write('\n')
   out.write(f"SCORE: {score}\n")
-  
+  return out.getvalue()
+
+
+class Renderer(object):
+  ''' Draws frames on an ANSI terminal, only the tiles that changed '''
+  def __init__(self, out=None):
+    self.out = sys.stdout if out is None else out
+    self.started = False
+    self.height = 0
+
+  def draw(self, screen, dirty):
+    moves = []
+    if not self.started:
+      # clear the terminal, tiles are placed by absolute cursor moves
+      moves.append('\x1b[2J')
+      self.started = True
+    height = self.height
+    for (x, y) in dirty:
+      if x < 0:
+        continue
+      moves.append(f"\x1b[{y+1};{x+1}H{TILE_NAMES[screen[(x,y)]]}")
+      if y >= height:
+        height = y + 1
+    if (-1,0) in dirty or height != self.height:
+      self.height = height
+      moves.append(f"\x1b[{height+1};1HSCORE: {screen.get((-1,0), '-1')}\x1b[K")
+    # leave the cursor under the frame
+    moves.append(f"\x1b[{self.height+2};1H")
+    self.out.write(''.join(moves))
+    self.out.flush()
 
-  if sys.stdout.isatty():
-    out.seek(0)
-    print(out.read())
     
-def run_game(program, screen):
+def run_game(program, screen, renderer=None, policy=None):
   # play for free
   program.code[0] = 2
-  inp = "0"
+  game = program.records(3)
+  tiles = []
+  if policy is None:
+    policy = follow_ball
+  pad = None
+  ball = None
+  inp = None
+  frame = 0
+  # tiles changed since the last frame, only tracked for a renderer
+  dirty = set() if renderer is not None else None
   while True:
-    out = StringIO()
-    old_stdout = sys.stdout
-    standalone(program, inp, out)
-    (pad, ball) = update_screen(screen, out.read().split('\n'))
-    sys.stdout = old_stdout
-    render_game(screen)
-    if ball is None:
+    try:
+      out = game.send(inp)
+    except StopIteration:
       break
-    # Make pad follow the ball, to play automatically
-    if ball > pad:
-      inp = "1"
-    elif ball < pad:
-      inp = "-1"
-    else:
-      inp = "0"
+    inp = None
+    if out is not None:
+      tiles.append(out)
+      continue
+
+    # waiting on the joystick, draw the frame
+    (new_pad, new_ball) = update_screen(screen, tiles, dirty)
+    tiles = []
+    if new_pad is not None:
+      pad = new_pad
+    if new_ball is not None:
+      ball = new_ball
+    if renderer is not None:
+      renderer.draw(screen, dirty)
+      dirty.clear()
+    inp = policy(GameState(screen, pad, ball, screen.get((-1,0), 0), frame))
+    frame += 1
     #inp = input("Move joystick: ")
+
+  # final frame after the game halted
+  update_screen(screen, tiles, dirty)
+  if renderer is not None:
+    renderer.draw(screen, dirty)
+
+
+def follow_ball(state):
+  # Make pad follow the ball, to play automatically
+  if state.ball > state.pad:
+    return 1
+  elif state.ball < state.pad:
+    return -1
+  return 0
+
+
+class NoisyFollower(object):
+  ''' Follows the ball, but moves at random with probability noise '''
+  def __init__(self, seed, noise=0.1):
+    self.seed = seed
+    self.noise = noise
+    self.random = random.Random(seed)
+
+  def __call__(self, state):
+    if self.random.random() < self.noise:
+      return self.random.choice((-1, 0, 1))
+    return follow_ball(state)
+
+  def __repr__(self):
+    return f"NoisyFollower({self.seed}, {self.noise})"
+
+
+def auto_play(program, on_frame=None, every=1, policy=None):
+  ''' Play headless inside the VM loop, the joystick is computed by the
+  input callback from the latest outputs. on_frame(frame, screen) is called
+  every `every` frames. Returns the final score and blocks left '''
+  if policy is None:
+    policy = follow_ball
+  program.code[0] = 2
+  screen = {}
+  pad = None
+  ball = None
+  frame = 0
+
+  def drain():
+    nonlocal pad, ball
+    outputs = program.outputs
+    while len(outputs) >= 3:
+      x = outputs.popleft()
+      y = outputs.popleft()
+      tileid = outputs.popleft()
+      screen[(x,y)] = tileid
+      if tileid == TILE_BALL:
+        ball = x
+      elif tileid == TILE_HPADDLE:
+        pad = x
+
+  def joystick():
+    nonlocal frame
+    drain()
+    if on_frame is not None and frame % every == 0:
+      on_frame(frame, screen)
+    state = GameState(screen, pad, ball, screen.get((-1,0), 0), frame)
+    frame += 1
+    return policy(state)
+
+  program.on_input = joystick
+  try:
+    intcode(program)
+  finally:
+    program.on_input = None
+  drain()
+  return (screen.get((-1,0), 0), count_tiles(screen, TILE_BLOCK))
+
+
+GAME_SNAPSHOT = None
+
+def init_policy_worker(snapshot):
+  global GAME_SNAPSHOT
+  GAME_SNAPSHOT = snapshot
+
+
+def evaluate_policy(policy, snapshot=None):
+  if snapshot is None:
+    snapshot = GAME_SNAPSHOT
+  program = Program(snapshot.memory)
+  program.restore(snapshot)
+  program.jit = True
+  steps = 0
+
+  def count(frame, screen):
+    nonlocal steps
+    steps += 1
+
+  start = time.perf_counter()
+  (score, blocks) = auto_play(program, count, policy=policy)
+  return PolicyResult(score, blocks, steps, time.perf_counter() - start)
+
+
+def evaluate_policies(program, policies, workers=None):
+  ''' Play a game per policy, all starting from the same snapshot taken
+  once free play is set. Policies must be picklable for workers != 1 '''
+  program.code[0] = 2
+  snapshot = program.snapshot()
+  if workers == 1:
+    return [evaluate_policy(policy, snapshot) for policy in policies]
+
+  with ProcessPoolExecutor(workers, initializer=init_policy_worker,
+                           initargs=(snapshot,)) as executor:
+    return list(executor.map(evaluate_policy, policies))
   
   
 
-def update_screen(screen, tileinfo):
+def update_screen(screen, tileinfo, dirty=None):
   ball_loc = None
   pad_loc = None
-  game = []
-  for output in tileinfo:
-    output = output.rstrip()
-    if output:
-      game.append(output)
-  #logging.debug(",".join(game))
-  xsize = 0
-  ysize = 0
-  while game:
-    x = int(game.pop(0))
-    y = int(game.pop(0))
-    tileid = int(game.pop(0))
+  for (x, y, tileid) in tileinfo:
+    if dirty is not None and screen.get((x,y)) != tileid:
+      dirty.add((x,y))
     screen[(x,y)] = tileid
     if tileid == TILE_BALL:
       ball_loc = x
@@ -91,22 +254,12 @@ def update_screen(screen, tileinfo):
       pad_loc = x
     if x == -1:
       logging.info(f"Score: {tileid}")
-    else:
-      logging.info(f"({x},{y}): {TILE_NAMES[tileid]}")
-    # store sizes for rendering
-    if x > xsize:
-      xsize = x
-    if y > ysize:
-      ysize = y
-
-  logging.info(f"{xsize=}{ysize=}")
+
   return (pad_loc, ball_loc)
 
 def init_game(program):
-  out = StringIO()
-  standalone(program, '', out)
   screen = {}
-  update_screen(screen, out.read().split('\n'))
+  update_screen(screen, program.records(3))
   return screen
   
 
@@ -1,15 +1,16 @@
 #!/usr/bin/env python3
 import fileinput
+import json
 import logging
+import os
 import sys
-from io import StringIO
-from queue import Queue
-from queue import PriorityQueue
-from queue import LifoQueue
-from collections import defaultdict
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
 
-from day2 import Program, standalone
+from day2 import Program
+from grid import SparseGrid
 
 logger = logging.getLogger('Droid')
 logger.setLevel(logging.INFO)
@@ -20,16 +21,6 @@ class Direction(Enum):
   WEST  = 3
   EAST  = 4
 
-  def opposite(self):
-    if self == self.NORTH:
-      return self.SOUTH
-    elif self == self.SOUTH:
-      return self.NORTH
-    elif self == self.EAST:
-      return self.WEST
-    elif self == self.WEST:
-      return self.EAST
-  
 
 class Location:
   class Type(Enum):
@@ -45,81 +36,22 @@ class Location:
               self.UNKNOWN.value: '.'}
       return symb[self.value]
 
+  __slots__ = ('x', 'y', 'type')
+
   def __init__(self, x, y):
     self.x = x
     self.y = y
-    self._type = None
-    self._pred = None
-    self._pred_direction = None
-
-  @property
-  def type(self):
-    return self._type
-
-  @type.setter
-  def type(self, t):
-    self._type = t
-
-  @property
-  def pred(self):
-    return self._pred
-
-  @pred.setter
-  def pred(self, p):
-    self._pred = p
-
-  @property
-  def pred_direction(self):
-    ''' direction which if followed from self leads to self.pred'''
-    return self._pred_direction
-
-  @pred_direction.setter
-  def pred_direction(self, p):
-    self._pred_direction = p
+    self.type = None
 
   @property
   def tuple(self):
-    return self.__key()
-
-  def update(self, direction):
-    if direction == Direction.NORTH:
-      self.y += 1
-    elif direction == Direction.SOUTH:
-      self.y -= 1
-    elif direction == Direction.EAST:
-      self.x += 1
-    elif direction == Direction.WEST:
-      self.x -= 1
-
-  def get_neighbors(self):
-    neighbors = []
-    for direction in Direction:
-      loc = Location(self.x, self.y)
-      loc.update(direction)
-      neighbors.append((loc, direction))
-    return neighbors
-           
-
-  def copy(self):
-    l = Location(self.x, self.y)
-    l.type = self.type
-    l.pred = self.pred
-    return l
-
-  def __key(self):
     return (self.x, self.y)
 
   def __hash__(self):
-    return hash(self.__key())
+    return hash((self.x, self.y))
 
   def __eq__(self, other):
-    return self.__key() == other.__key()
-
-  def __lt__(self, other):
-    #manhattan distance 
-    origin_from_self = abs(self.x) + abs(self.y)
-    origin_from_other = abs(other.x) + abs(other.y)
-    return origin_from_self < origin_from_other
+    return (self.x, self.y) == (other.x, other.y)
 
   def __repr__(self):
     return f"({self.x},{self.y})[{self.type}]"
@@ -133,119 +65,15 @@ class RepairDroid(object):
 
   def __init__(self, code):
     self.program = Program(code)
+    self.program.jit = True
     self.location = Location(0,0)
     
-  def find_oxygen_system(self, early_exit=False):
-    old_out = sys.stdout
-    system_location = None
-    system_location_cost = 0
-    frontier = PriorityQueue()
-    came_from = {}
-    cost_so_far = {}
-    self.location.type = Location.Type.PATH
-    came_from[self.location.tuple] = None
-    self.explored = {}
-    cost_so_far[self.location.tuple] = 0
-    frontier.put((0,self.location))
-    # cheat: known location of oxygen system to feed A*
-    oxy_loc = Location(-20, -14)
+  def find_oxygen_system(self, early_exit=False, workers=1, renderer=None):
+    (system_location, system_location_cost) = self.explore(early_exit, workers,
+                                                           renderer)
     oxygen_ticks = 0
-
-    while not frontier.empty():
-      logger.debug("")
-      logger.debug(f"{frontier.queue=}")
-      logger.debug("")
-      logger.debug(f"{len(came_from.keys())=}")
-      logger.debug(f"{cost_so_far=}")
-
-      oxygen_ticks, current = frontier.get()
-
-      # move to current
-      self.move_to_location(current)
-
-      # explore neighbors  
-      neighbors = current.get_neighbors()
-      for neighbor, direction in neighbors:
-
-        if neighbor.tuple not in came_from:
-
-          status = self.move(direction)
-
-          # to get to pred from neighbor, follow opposite direction
-          neighbor.pred = current
-          neighbor.pred_direction = direction.opposite()
-          came_from[neighbor.tuple] = current
-          self.explored[neighbor] = True
-
-          if status == self.Status.WALL:
-            neighbor.type = Location.Type.WALL
-          else:
-            # move back to current
-            logger.debug("Moving Back >>>")
-            self.move(direction.opposite())
-            logger.debug("Moved Back <<<")
-
-            if status == self.Status.MOVED:
-              if system_location:
-                # mark paths as filled with oxygen
-                # after the oxygen station was found
-                neighbor.type = Location.Type.SYSTEM
-              else:
-                neighbor.type = Location.Type.PATH
-                
-            elif status == self.Status.FOUND:
-              if system_location:
-                continue
-              neighbor.type = Location.Type.SYSTEM
-              system_location = neighbor
-              system_location_cost = cost_so_far[current.tuple] + 1
-              if early_exit:
-                break
-              #redefine origin
-              oxygen_ticks = 0
-              frontier = PriorityQueue()
-              came_from = {}
-              cost_so_far = {}
-              came_from[neighbor.tuple] = None
-              cost_so_far[neighbor.tuple] = 0
-              # Clear paths from explored for re-rendering
-              new_explored = {}
-              for loc in self.explored.keys():
-                if loc.type != Location.Type.PATH:
-                  new_explored[loc] = True
-              self.explored = new_explored
-
-              frontier.put((oxygen_ticks,neighbor))
-              break #from for
-
-            # only put walkable blocks into frontier for further exploration
-            new_cost = cost_so_far[current.tuple] + 1
-            logger.debug(f"{new_cost=} {neighbor.tuple in cost_so_far}")
-            if (neighbor.tuple not in cost_so_far or 
-                new_cost < cost_so_far[neighbor.tuple]):
-              cost_so_far[neighbor.tuple] = new_cost
-              heuristic = (abs(oxy_loc.x - neighbor.x) +
-                           abs(oxy_loc.y - neighbor.y))
-              #priority =  new_cost 
-              #priority =  new_cost + heuristic
-              # fastest reaching oxygen system
-              if system_location:
-                # using priority to determine seconds of oxygen, 
-                # as we process 1 second once we've processed all adjacent neighbors
-                priority = oxygen_ticks + 1
-              else:
-                priority = heuristic
-              logger.debug(f"Adding {neighbor=} to frontier")
-              frontier.put((priority, neighbor))
-
-
-      sys.stdout = old_out
-      self.render()
-      if system_location and early_exit:
-        break
-
-      # move back
-      self.move_to_origin(current)
+    if system_location and not early_exit:
+      oxygen_ticks = self.graph.flood_time()
 
     logger.info(f"{system_location=}")
     logger.info(f"{system_location_cost=}")
@@ -253,73 +81,339 @@ class RepairDroid(object):
 
     return system_location
 
-  def render(self):
-    size = 48
-    mid = size//2
-    screen =[['.'] * size for i in range(size)]
-     
-    for loc in self.explored.keys():
-      symbol = loc.type.symbol()
-      if loc.tuple == self.location.tuple:
-        symbol = '@'
-      screen[mid+loc.y][mid+loc.x] = symbol
-
-    output = StringIO()
-    for y in range(size):
-      for x in range(size):
-        output.write(f"{screen[y][x]}")
-      output.write('\n')
-    output.seek(0)
-    print(output.read())
-
-  def move(self, d):
-    direction = Direction(d)
-    inp = f"{direction.value}"
-    out = StringIO()
-    logger.debug(f"Moving {direction.name}")
-    standalone(self.program, inp, out)
-    status = self.Status(int(out.read().rstrip()))
-    logger.debug(f"({status.name})")
-
-    if status in [self.Status.MOVED, self.Status.FOUND]:
-      self.location.update(direction)
-    return status
-
-  def move_to_location(self, location):
-    logger.debug(f"Moving to {location=} >>>")
-    path = LifoQueue()
-    curr = location
-
-    while curr.pred:
-      if curr == self.location:
-        break
-      # to move from origin, follow opposite directions
-      path.put(curr.pred_direction.opposite())
-      curr = curr.pred
-
-    while not path.empty():
-      next_direction = path.get()
-      self.move(next_direction)
-
-    logger.debug(f"Moved to {self.location.tuple} <<<")
-
-  def move_to_origin(self, curr):
-    logger.debug(f"Moving to origin from {curr} >>>")
-    while curr.pred:
-      # to move to origin, follow pred direction
-      status = self.move(curr.pred_direction)
-      if status != self.Status.MOVED:
-        # early exit
+  def explore(self, early_exit=False, workers=1, renderer=None,
+              parallel_frontier=256):
+    ''' Map the maze breadth first. Every open cell keeps a fork of the
+    program standing on it, neighbours are tried on forks of that one, so
+    the droid never walks back. Returns the system location and its
+    distance from the start. Nothing is drawn without a renderer.
+    With workers != 1, levels of at least parallel_frontier cells are
+    expanded across a process pool '''
+    wall = self.Status.WALL.value
+    found = self.Status.FOUND.value
+    system = None
+    system_location_cost = 0
+    origin = pack(*self.location.tuple)
+    # packed location: status, all the cells tried so far
+    self.cells = cells = {origin: self.Status.MOVED.value}
+    if renderer is not None:
+      renderer.droid = self.location.tuple
+      renderer.update(origin, cells[origin])
+    frontier = [(origin, self.program.fork())]
+    executor = None
+    if workers != 1:
+      workers = workers or os.cpu_count()
+      executor = ProcessPoolExecutor(workers)
+    try:
+      cost = 0
+      while frontier and not (system is not None and early_exit):
+        cost += 1
+        if executor is None or len(frontier) < parallel_frontier:
+          # a pool round trip costs more than a narrow level
+          expanded = [expand_cell(key, program, cells)
+                      for (key, program) in frontier]
+        else:
+          # one job per worker, each carrying only the seen neighbours
+          # of its own cells
+          expanded = []
+          size = -(-len(frontier) // workers)
+          jobs = []
+          for i in range(0, len(frontier), size):
+            chunk = frontier[i:i+size]
+            seen = {key + offset for (key, _) in chunk for (_, offset) in MOVES}
+            seen.intersection_update(cells)
+            jobs.append(executor.submit(expand_chunk,
+              [(key, program.snapshot()) for (key, program) in chunk], seen))
+          for job in jobs:
+            expanded.extend([(neighbor, status, resume(snapshot))
+                             for (neighbor, status, snapshot) in tried]
+                            for tried in job.result())
+
+        frontier = []
+        for tried in expanded:
+          for (neighbor, status, program) in tried:
+            if neighbor in cells:
+              # reached from another cell of the same level first
+              continue
+            cells[neighbor] = status
+            if renderer is not None:
+              renderer.update(neighbor, status)
+            if status == wall:
+              continue
+            if status == found and system is None:
+              system = neighbor
+              system_location_cost = cost
+            frontier.append((neighbor, program))
+          if renderer is not None:
+            renderer.step()
+    finally:
+      if executor is not None:
+        executor.shutdown()
+    if renderer is not None:
+      renderer.draw()
+
+    self.maze = {unpack(key): Location.Type(status) for key, status in cells.items()}
+    system_location = None
+    if system is not None:
+      system_location = Location(*unpack(system))
+      system_location.type = Location.Type.SYSTEM
+    self.graph = MazeGraph.from_maze(self.maze, self.location.tuple,
+                                     system_location and system_location.tuple)
+    return (system_location, system_location_cost)
+
+
+# Explored cells are keyed by packed ints, x and y biased into 32 bits each.
+# Neighbours are found by adding MOVES offsets to a key, so pack keeps one
+# cell of margin on every side for them not to wrap into the next row
+STRIDE = 1 << 32
+BIAS = 1 << 31
+
+def pack(x, y):
+  if not (-BIAS < x < BIAS - 1 and -BIAS < y < BIAS - 1):
+    raise ValueError(f"({x},{y}) is out of the packable range")
+  return (y + BIAS) * STRIDE + x + BIAS
+
+def unpack(key):
+  (y, x) = divmod(key, STRIDE)
+  return (x - BIAS, y - BIAS)
+
+# movement command and packed offset of each direction
+MOVES = (
+  (Direction.NORTH.value, STRIDE),
+  (Direction.SOUTH.value, -STRIDE),
+  (Direction.WEST.value, -1),
+  (Direction.EAST.value, 1),
+)
+
+def expand_cell(key, program, seen):
+  ''' Try every direction not in seen from an open cell, on forks of its
+  program. Returns (neighbor, status, program standing on neighbor) '''
+  tried = []
+  for (command, offset) in MOVES:
+    neighbor = key + offset
+    if neighbor in seen:
+      continue
+    droid = program.fork()
+    (status,) = droid.run(command)
+    tried.append((neighbor, status, droid))
+  return tried
+
+
+def expand_chunk(frontier, seen):
+  ''' expand_cell over part of a level in a worker, programs travel as
+  snapshots both ways '''
+  expanded = []
+  for (key, snapshot) in frontier:
+    tried = expand_cell(key, resume(snapshot), seen)
+    expanded.append([(neighbor, status, program.snapshot())
+                     for (neighbor, status, program) in tried])
+  return expanded
+
+
+def resume(snapshot):
+  program = Program(snapshot.memory)
+  program.restore(snapshot)
+  program.jit = True
+  return program
+
+
+# Breadth first walk from one source: steps and predecessor per cell index,
+# -1 where unreachable, and the cell indexes at each distance
+Layers = namedtuple('Layers', ['depth', 'pred', 'layers'])
+
+class MazeGraph(object):
+  ''' Explored maze as a flat row-major grid of Location.Type values,
+  answering path queries from breadth first layers computed once per
+  source '''
+  SYMBOLS = '# O.'
+  OPEN = (Location.Type.PATH.value, Location.Type.SYSTEM.value)
+
+  def __init__(self, cells, width, min_x, min_y, start, system=None):
+    self.cells = cells
+    self.width = width
+    self.min_x = min_x
+    self.min_y = min_y
+    self.start = start
+    self.system = system
+    # source index: Layers
+    self.walks = {}
+
+  @classmethod
+  def from_maze(cls, maze, start, system=None):
+    # a border of unknown cells keeps neighbour offsets from wrapping rows
+    min_x = min(x for (x, y) in maze) - 1
+    min_y = min(y for (x, y) in maze) - 1
+    width = max(x for (x, y) in maze) - min_x + 2
+    height = max(y for (x, y) in maze) - min_y + 2
+    cells = bytearray([Location.Type.UNKNOWN.value]) * (width * height)
+    for (x, y), kind in maze.items():
+      cells[(y - min_y) * width + x - min_x] = kind.value
+    return cls(cells, width, min_x, min_y, start, system)
+
+  def index(self, location):
+    (x, y) = location
+    column = x - self.min_x
+    row = y - self.min_y
+    if not (0 <= column < self.width and 0 <= row * self.width < len(self.cells)):
+      raise KeyError(f"{location} is outside of the maze")
+    return row * self.width + column
+
+  def location(self, index):
+    (row, column) = divmod(index, self.width)
+    return (column + self.min_x, row + self.min_y)
+
+  def walk(self, source):
+    ''' Layers from source, cached. Nothing is reachable from a cell
+    that is not open '''
+    origin = self.index(source)
+    if origin in self.walks:
+      return self.walks[origin]
+    cells = self.cells
+    depth = array('i', [-1]) * len(cells)
+    pred = array('i', [-1]) * len(cells)
+    if cells[origin] not in self.OPEN:
+      # walls and padding, whose neighbours may be past the end
+      walk = self.walks[origin] = Layers(depth, pred, [])
+      return walk
+    offsets = (-self.width, self.width, -1, 1)
+    depth[origin] = 0
+    layers = [[origin]]
+    while True:
+      layer = []
+      steps = len(layers)
+      for index in layers[-1]:
+        for offset in offsets:
+          neighbor = index + offset
+          if depth[neighbor] < 0 and cells[neighbor] in self.OPEN:
+            depth[neighbor] = steps
+            pred[neighbor] = index
+            layer.append(neighbor)
+      if not layer:
         break
-      curr = curr.pred
-    logger.debug(f"Moved to origin {self.location.tuple}<<<")
+      layers.append(layer)
+    walk = self.walks[origin] = Layers(depth, pred, layers)
+    return walk
+
+  def distance(self, source, target):
+    ''' Steps from source to target, None if unreachable '''
+    steps = self.walk(source).depth[self.index(target)]
+    return steps if steps >= 0 else None
+
+  def path(self, source, target):
+    ''' Locations from source to target, both included, None if unreachable '''
+    walk = self.walk(source)
+    index = self.index(target)
+    if walk.depth[index] < 0:
+      return None
+    path = []
+    while index >= 0:
+      path.append(self.location(index))
+      index = walk.pred[index]
+    path.reverse()
+    return path
+
+  def layer(self, source, steps):
+    ''' Locations exactly steps away from source '''
+    layers = self.walk(source).layers
+    if steps >= len(layers):
+      return []
+    return [self.location(index) for index in layers[steps]]
+
+  def eccentricity(self, source):
+    ''' Steps to the farthest cell from source, None if source is not open '''
+    layers = self.walk(source).layers
+    return len(layers) - 1 if layers else None
+
+  def flood_time(self, source=None):
+    ''' Minutes for oxygen to fill the maze from source, the system by default '''
+    return self.eccentricity(self.system if source is None else source)
+
+  def to_json(self):
+    rows = []
+    for offset in range(0, len(self.cells), self.width):
+      rows.append(''.join(self.SYMBOLS[value]
+                          for value in self.cells[offset:offset+self.width]))
+    return {
+      'min_x': self.min_x,
+      'min_y': self.min_y,
+      'start': self.start,
+      'system': self.system,
+      'rows': rows,
+    }
+
+  @classmethod
+  def from_json(cls, data):
+    values = {symbol: value for value, symbol in enumerate(cls.SYMBOLS)}
+    rows = data['rows']
+    cells = bytearray(values[symbol] for row in rows for symbol in row)
+    system = data['system']
+    return cls(cells, len(rows[0]), data['min_x'], data['min_y'],
+               tuple(data['start']), system and tuple(system))
+
+  def save(self, path):
+    with open(path, 'w') as out:
+      json.dump(self.to_json(), out, indent=1)
+
+  @classmethod
+  def load(cls, path):
+    with open(path) as inp:
+      return cls.from_json(json.load(inp))
+
+
+class MazeRenderer(object):
+  ''' Draws the maze on an ANSI terminal while it is explored, sized to the
+  explored area. Redraws every `every` expanded cells, only the cells found
+  since the last frame unless the area grew. every=0 draws the final map
+  only '''
+  def __init__(self, every=1, out=None):
+    self.every = every
+    self.out = sys.stdout if out is None else out
+    self.grid = SparseGrid(default=Location.Type.UNKNOWN.value)
+    self.droid = (0, 0)
+    self.dirty = []
+    self.steps = 0
+    # bounds of the last frame drawn
+    self.drawn = None
+
+  def update(self, key, status):
+    location = unpack(key)
+    self.grid[location] = status
+    self.dirty.append(location)
+
+  def step(self):
+    self.steps += 1
+    if self.every and self.steps % self.every == 0:
+      self.draw()
+
+  def draw(self):
+    bounds = self.grid.bounds
+    if bounds is None:
+      return
+    (min_x, min_y, max_x, max_y) = bounds
+    if bounds != self.drawn:
+      # the map grew, every cell moves on the terminal
+      moves = ['\x1b[2J\x1b[H', self.grid.render(MazeGraph.SYMBOLS)]
+      self.drawn = bounds
+      changed = [self.droid]
+    else:
+      moves = []
+      changed = self.dirty
+    for (x, y) in changed:
+      symbol = '@' if (x, y) == self.droid else MazeGraph.SYMBOLS[self.grid[(x,y)]]
+      moves.append(f"\x1b[{y-min_y+1};{x-min_x+1}H{symbol}")
+    self.dirty = []
+    # leave the cursor under the map
+    moves.append(f"\x1b[{max_y-min_y+2};1H")
+    self.out.write(''.join(moves))
+    self.out.flush()
 
 
 def main():
   logging.basicConfig(level=logging.ERROR)
   for line in fileinput.input():
     droid = RepairDroid(line)
-    droid.find_oxygen_system()
+    renderer = MazeRenderer() if sys.stdout.isatty() else None
+    droid.find_oxygen_system(renderer=renderer)
 
 
 if __name__ == '__main__':
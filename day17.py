@@ -2,7 +2,6 @@
 import fileinput
 import logging
 import sys
-from io import StringIO
 
 from day2 import Program
 
@@ -14,18 +13,18 @@ def main():
     r = VaccumRobot(line)
     r.build_scaffold_view()
     r.find_intersections()
-    r.render_view()
-    path = []
-    r.dfs(path)
-    # HACK: adding the last movement, as it wasn't added because no turn was made
-    path.append(6)
+    path = r.walk_path()
+    if sys.stdout.isatty():
+      # the scaffold with the robot at the end of the path
+      r.render_view()
     logger.info(f"{','.join(str(p) for p in path)=}")
     r = VaccumRobot(line)
     r.run_pattern(path)
 
 class VaccumRobot:
   def __init__(self, map_data):
-    self.program = Program(map_data, rw=0, output=StringIO())
+    self.program = Program(map_data)
+    self.camera = []
     self.scaffold_view = None
     self.xsize = 0
     self.ysize = 0
@@ -35,25 +34,19 @@ class VaccumRobot:
     self.intersections = {}
 
   def build_scaffold_view(self):
-    status = self.program.exec_standalone('')
+    # the camera frame ends with an empty line
+    self.camera = [line for line in self.program.lines() if line]
     #self.render()
 
-    x, y = 0, 0
     view = {}
-    for line in self.program.output:
-      pixel = int(line.strip())
-      if pixel == ord('\n'):
-        if y > self.ysize:
-          self.ysize = y
-        y+=1
-        x = 0
-      elif pixel == ord('^'):
-        self.xposition = x
-        self.yposition = y
-      view[(x,y)] = pixel
-      if x > self.xsize:
-        self.xsize = x
-      x+=1
+    for y, line in enumerate(self.camera):
+      for x, pixel in enumerate(line):
+        if pixel == '^':
+          self.xposition = x
+          self.yposition = y
+        view[(x,y)] = ord(pixel)
+      self.xsize = max(self.xsize, len(line))
+    self.ysize = len(self.camera)
     self.view = view
         
       
@@ -64,13 +57,11 @@ class VaccumRobot:
         if x == self.xposition and y == self.yposition:
           p = self.direction
         sys.stdout.write(p)
-    sys.stdout.write('\n')
+      sys.stdout.write('\n')
 
   def render(self):
-    self.program.output.seek(0)
-    for line in self.program.output:
-      sys.stdout.write(chr(int(line.strip())))
-    self.program.output.seek(0)
+    for line in self.camera:
+      sys.stdout.write(f"{line}\n")
 
   def find_intersections(self):
     alignment_params = []
@@ -78,9 +69,9 @@ class VaccumRobot:
       if pixel == ord('#'):
         neighbors = [(x+1,y), (x-1,y), (x,y+1), (x,y-1)]
         if all(self.view.get((nx,ny)) == ord('#') for nx,ny in neighbors):
-          logger.debug(f"Intersection {x-1},{y}")
+          logger.debug(f"Intersection {x},{y}")
           self.intersections[(x,y)] = None
-          alignment_params.append(abs((x-1)*y))
+          alignment_params.append(x*y)
           #self.view[(x,y)] = 73
     calibration_code = sum(alignment_params)
     logger.debug(f"{calibration_code}")
@@ -89,73 +80,54 @@ class VaccumRobot:
   def opposite(self, direc):
     return {'^': 'v', '>':'<', '<':'>', 'v':'^'}[direc]
 
-  def get_neighbors(self, favored_direction):
-    x = self.xposition
-    y = self.yposition
-    # R D L U
-    directions = ['>', 'v', '<', '^']
-    index_favored = directions.index(favored_direction) 
-    directions = directions[index_favored:] + directions[0:index_favored]
-    neighbors = [(x+1,y), (x,y+1), (x-1,y), (x,y-1)]
-    neighbors = neighbors[index_favored:] + neighbors[0:index_favored]
-    return zip(directions, neighbors)
-    
-
-  def get_turn(self, new_dir):
-    turn = None
-    if (self.direction == '^' and new_dir == '>' or
-        self.direction == '>' and new_dir == 'v' or
-        self.direction == 'v' and new_dir == '<' or
-        self.direction == '<' and new_dir == '^'):
-      turn = 'R'
-    if (self.direction == '^' and new_dir == '<' or
-        self.direction == '<' and new_dir == 'v' or
-        self.direction == 'v' and new_dir == '>' or
-        self.direction == '>' and new_dir == '^'): turn =  'L'
-    logger.debug(f"Turn from {self.direction} to {new_dir}: {turn}")
-    return turn
-
-  def dfs(self, path=None, movement=0, visited=None):
-    if visited is None:
-      visited = {}
-
-    if path is None:
-      path = []
-
-    visited[ (self.xposition, self.yposition) ] = self.direction
-    logger.debug(f"{self.xposition}, {self.yposition}")
-    self.render_view()
-    #import pdb; pdb.set_trace()
-
-    for d, n in self.get_neighbors(self.direction):
-      if n not in visited:
-        if self.view.get(n) == ord('#'):
-          self.xposition, self.yposition = n
-
-          if d != self.direction:
-            # turn
-            turn = self.get_turn(d)
-            if movement:
-              path.append(movement)
-            path.append(turn)
-            movement = 0
-
-          self.direction = d
-
-          movement += 1
-
-          self.dfs(path, movement, visited)
-      else:
-        if n in self.intersections:
-          if visited[n] != self.direction:
-            self.xposition, self.yposition = n
-            self.direction = d
-
-            movement += 1 
-
-            self.dfs(path, movement, visited)
-    # TODO:at the end of the path, we must add the movement even if there's no turn
-    # thus need a way to detect we are at the end (probably all neighbors are '.' and prev is in visited)
+  def walk_path(self):
+    ''' Movement commands from the robot to the end of the scaffold, going
+    straight through intersections and turning only where it bends '''
+    # scaffold cells in a bytearray padded by one empty cell on every side,
+    # so stepping off the view never wraps around a row
+    width = self.xsize + 2
+    scaffold = bytearray(width * (self.ysize + 2))
+    for (x, y), pixel in self.view.items():
+      if pixel != ord('.'):
+        scaffold[(y+1)*width + x+1] = 1
+    # clockwise, turning right is the next heading
+    headings = ['^', '>', 'v', '<']
+    offsets = [-width, 1, width, -1]
+
+    heading = headings.index(self.direction)
+    position = (self.yposition+1)*width + self.xposition+1
+    path = []
+    # (position, heading) each run started from, a closed scaffold ends
+    # after one lap instead of circling forever
+    runs = set()
+    while True:
+      turn = None
+      change = 0
+      if not scaffold[position + offsets[heading]]:
+        for (turn, change) in (('R', 1), ('L', -1)):
+          if scaffold[position + offsets[(heading + change) % 4]]:
+            break
+        else:
+          # dead end
+          break
+      run = (position, (heading + change) % 4)
+      if run in runs:
+        break
+      runs.add(run)
+      heading = run[1]
+      if turn is not None:
+        path.append(turn)
+      offset = offsets[heading]
+      steps = 0
+      while scaffold[position + offset]:
+        position += offset
+        steps += 1
+      path.append(steps)
+
+    (y, x) = divmod(position, width)
+    (self.xposition, self.yposition) = (x-1, y-1)
+    self.direction = headings[heading]
+    return path
 
   def run_pattern(self, path):
     input("PAUSE")
@@ -168,23 +140,15 @@ class VaccumRobot:
     C = 'L,12,L,6,R,10,L,6\n'
     pattern_path = "A,A,C,B,B,A,B,C,B,C\n"
 
-    inputs = None
-    newline = '\n'
-    main_movement = f"{newline.join(list(str(ord(p)) for p in pattern_path))}"
-    func_a = f"{newline.join(list(str(ord(p)) for p in A))}"
-    func_b = f"{newline.join(list(str(ord(p)) for p in B))}"
-    func_c = f"{newline.join(list(str(ord(p)) for p in C))}"
-    video_feed = f"{ord('n')}{newline}10"
-    inputs = f"{main_movement}\n{func_a}\n{func_b}\n{func_c}\n{video_feed}"
+    video_feed = 'n\n'
+    inputs = [ord(p) for p in pattern_path + A + B + C + video_feed]
     logger.debug(f"{inputs=}")
 
     self.program.code[0] = 2 # get prompted for movement
-    self.program.output.seek(0)
-    self.program.output.truncate()
-    self.program.exec_standalone(inputs)
-    self.program.output.seek(0)
-    outp = self.program.output.read()
-    print(''.join([chr(int(line.rstrip())) for line in outp.split('\n') if line]))
+    self.program.inputs.extend(inputs)
+    for line in self.program.lines():
+      if line is not None:
+        print(line)
     
     
 if __name__ == '__main__':
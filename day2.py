@@ -2,14 +2,19 @@
 import logging
 import fileinput
 from itertools import product
-from collections import defaultdict
-from io import StringIO
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from collections import namedtuple
+import copy
 import operator
+import os
 import sys
 
 RET_STOP = 0
 RET_CONT = 1
 RET_NEWPC = 2
+RET_PAUSE = 3
 
 def op_sum(program, pmodes):
   return op_bin(program, pmodes, operator.add)
@@ -28,7 +33,6 @@ def op_bin(program, pmodes, operation):
   else:
     first_operand_location = arr[pos+1] + program.relative_base 
 
-  logging.debug(f"{first_operand_location=}")
   first_operand = arr[first_operand_location]
 
   if pmodes[1] == 0:
@@ -38,10 +42,8 @@ def op_bin(program, pmodes, operation):
   else:
     second_operand_location = arr[pos+2] +program.relative_base
 
-  logging.debug(f"{second_operand_location=}")
   second_operand = arr[second_operand_location]
 
-  logging.debug(f"{operation=} {first_operand=} {second_operand=}")
   op_result = operation(first_operand, second_operand)
 
   if pmodes[2] == 0:
@@ -52,7 +54,6 @@ def op_bin(program, pmodes, operation):
     logging.error(f"Write location parameter in immediate mode")
     return RET_STOP
 
-  logging.debug(f"{result_location=} {op_result=}")
   arr[result_location] = op_result
 
   return RET_CONT
@@ -61,11 +62,14 @@ def op_bin(program, pmodes, operation):
 def op_inp(program, pmodes):
   arr = program.code
   pos = program.pc
-  logging.info("INP:")
-  try:
-    inp = int(input())
-  except EOFError:
-    logging.info("Suspended")
+  if program.inputs:
+    inp = program.inputs.popleft()
+  elif program.on_input is not None:
+    inp = program.on_input()
+  else:
+    inp = None
+
+  if inp is None:
     return RET_STOP
 
   if pmodes[0] == 0:
@@ -77,8 +81,6 @@ def op_inp(program, pmodes):
     return RET_STOP
 
   arr[dest] = inp
-  logging.info(f"Read {inp=}")
-  logging.debug(f"Stored into {dest=}")
 
   return RET_CONT
 
@@ -86,7 +88,6 @@ def op_inp(program, pmodes):
 def op_out(program, pmodes):
   arr = program.code
   pos = program.pc
-  output = program.output
   if pmodes[0] == 0:
     out_loc = arr[pos+1]
   elif pmodes[0] == 1:
@@ -95,27 +96,21 @@ def op_out(program, pmodes):
     out_loc = arr[pos+1]+program.relative_base
   
   out = arr[out_loc]
-  logging.debug(f"{out_loc=}")
 
-  outmsg = f"{out}\n"
-  if output:
-    output.write(outmsg)
-    if program.rewind_output:
-      output.seek(output.tell() - len(outmsg))
-  logging.info(f"OUT: {out}")
+  program.outputs.append(out)
 
+  if program.pause_on_output:
+    return RET_PAUSE
   return RET_CONT
 
 
 def op_halt(program, pmodes):
-  arr = program.code
-  logging.info("HALT")
+  program.halted = True
   return RET_STOP
 
 def _op_jmp_cnd(program, pmodes, cnd):
   arr = program.code
   pos = program.pc
-  logging.debug(f"Jmp {cnd=}")
   new_pc = None
   if pmodes[0] == 0:
     flag_loc = arr[pos+1]
@@ -124,9 +119,7 @@ def _op_jmp_cnd(program, pmodes, cnd):
   else:
     flag_loc = arr[pos+1] + program.relative_base
     
-  logging.debug(f"{flag_loc=}")
   flag = arr[flag_loc]
-  logging.debug(f"{flag=}")
 
   if cnd(flag):
     if pmodes[1] == 0:
@@ -135,10 +128,8 @@ def _op_jmp_cnd(program, pmodes, cnd):
       new_pc_loc = pos+2
     else:
       new_pc_loc = arr[pos+2] + program.relative_base
-    logging.debug(f"{new_pc_loc=}")
     new_pc = arr[new_pc_loc]
     program.pc = new_pc
-    logging.debug(f"Jumped PC to {new_pc=}")
     return RET_NEWPC
 
   return RET_CONT
@@ -168,10 +159,8 @@ def op_rel(program, pmodes):
   else:
     rel_loc = arr[pos+1] + program.relative_base
 
-  logging.debug(f"{rel_loc=} {arr[rel_loc]=}")
   program.relative_base += arr[rel_loc]
 
-  logging.debug(f"Set {program.relative_base=}")
   return RET_CONT
 
 OPERATIONS = {
@@ -192,7 +181,6 @@ def read_instruction(instruction):
   parameter_modes = [] 
   opcode = instruction % 100
   power = 3
-  logging.debug(f"Processing {instruction=}")
   while instruction // pow(10,power-1):
     param_mode = ((instruction % pow(10,power)) - (instruction % pow(10,power -1))) // pow(10, power-1)
     parameter_modes.append(param_mode)
@@ -202,17 +190,89 @@ def read_instruction(instruction):
   # fill all missing params with zeroes, as that is default mode
   parameter_modes.extend( [0] * (num_params - len(parameter_modes)))
 
-  logging.debug(f"instruction {opcode=} ({opname}) [{num_params} params]")
-  logging.debug(f"{parameter_modes=}")
-  return (opcode, parameter_modes)
+  # digits past the last parameter are ignored
+  return (opcode, parameter_modes[:num_params])
+
+
+def decode_instruction(program, address):
+  # cache entries are keyed by address and tagged with the raw word,
+  # so self-modifying writes to an instruction invalidate its decode
+  instruction = program.code[address]
+  cached = program.decoded.get(address)
+  if cached is not None and cached[0] == instruction:
+    return cached
+
+  (opcode, param_modes) = read_instruction(instruction)
+  (operation, num_params, opname) = OPERATIONS[opcode]
+  cached = (instruction, operation, num_params, tuple(param_modes))
+  program.decoded[address] = cached
+  return cached
+
+
+class Memory(object):
+  ''' Contiguous Intcode memory, zero-filled and grown on demand '''
+  __slots__ = ('cells',)
+
+  def __init__(self, cells=()):
+    self.cells = list(cells)
+
+  def __getitem__(self, address):
+    if address < 0:
+      raise IndexError(f"Negative memory address {address}")
+    try:
+      return self.cells[address]
+    except IndexError:
+      return 0
+
+  def __setitem__(self, address, value):
+    if address < 0:
+      raise IndexError(f"Negative memory address {address}")
+    try:
+      self.cells[address] = value
+    except IndexError:
+      self.cells.extend([0] * (address - len(self.cells)))
+      self.cells.append(value)
+
+  def __len__(self):
+    return len(self.cells)
+
+  def __iter__(self):
+    return iter(self.cells)
+
+  def copy(self):
+    # a flat buffer copy, no per-cell rehashing
+    memory = Memory.__new__(Memory)
+    memory.cells = self.cells[:]
+    return memory
 
 
+Snapshot = namedtuple('Snapshot', ['memory', 'pc', 'relative_base', 'inputs',
+                                   'outputs', 'halted'])
+
 class Program(object):
   def __init__(self, code, pc=0, rb=0, rw=1, output=None):
     self.code = self.init_program(code)
     self.pc = pc 
     self.relative_base = rb
     self.rewind_output = rw
+    # address: (instruction, operation, num_params, param_modes)
+    self.decoded = {}
+    # integer I/O channels; on_input is asked for a value when inputs
+    # run dry, returning None suspends the program until more are fed
+    self.inputs = deque()
+    self.outputs = deque()
+    self.on_input = None
+    self.halted = False
+    self.pause_on_output = False
+    # called as trace(program, instruction, param_modes) before each
+    # instruction, None keeps intcode() on the untraced loop
+    self.trace = None
+    # with jit, called as trace_block(program, address, block, next_pc) after
+    # each compiled block; without it tracing disables the jit tier
+    self.trace_block = None
+    # compile hot straight-line code into python functions, see intcode_jit
+    self.jit = False
+    self.blocks = {}
     if output is None:
       self.output = sys.stdout
     else:
@@ -220,50 +280,543 @@ class Program(object):
 
   def init_program(self, codestring):
     if isinstance(codestring, str):
-      code = defaultdict(int)
-      data = (map(int,codestring.split(',')))
-      for i, instruction in enumerate(data):
-        code[i] = instruction
-      return code
-    else:
+      return Memory(map(int, codestring.split(',')))
+    elif isinstance(codestring, Memory):
       return codestring
+    else:
+      return Memory(codestring)
+
+  def run(self, *inputs):
+    ''' Feed inputs and run until halted or starved, returns the new outputs '''
+    self.inputs.extend(inputs)
+    intcode(self)
+    outputs = list(self.outputs)
+    self.outputs.clear()
+    return outputs
+
+  def stream(self):
+    ''' Generator over outputs, yields None while waiting for input.
+    Values given to send() are queued as inputs '''
+    self.pause_on_output = True
+    try:
+      while True:
+        if not self.outputs:
+          if self.halted:
+            return
+          intcode(self)
+        if self.outputs:
+          value = yield self.outputs.popleft()
+        elif self.halted:
+          return
+        else:
+          value = yield None
+        if value is not None:
+          self.inputs.append(value)
+    finally:
+      self.pause_on_output = False
+
+  def records(self, arity):
+    ''' Like stream(), grouping outputs into tuples of arity values '''
+    stream = self.stream()
+    record = []
+    value = None
+    while True:
+      try:
+        out = stream.send(value)
+      except StopIteration:
+        break
+      value = None
+      if out is None:
+        value = yield None
+        continue
+      record.append(out)
+      if len(record) == arity:
+        value = yield tuple(record)
+        record = []
+    if record:
+      logging.warning(f"Program halted in the middle of a record: {record}")
+
+  def lines(self):
+    ''' Like stream() for ASCII programs, yields text lines without the
+    newline and values outside of ASCII as ints. Strings sent are fed as
+    ASCII input '''
+    stream = self.stream()
+    line = []
+    text = None
+    while True:
+      if text:
+        self.inputs.extend(map(ord, text))
+      try:
+        out = stream.send(None)
+      except StopIteration:
+        break
+      text = None
+      if out is None:
+        text = yield None
+      elif out == 10:
+        text = yield ''.join(line)
+        line = []
+      elif 0 <= out < 128:
+        line.append(chr(out))
+      else:
+        text = yield out
+    if line:
+      yield ''.join(line)
+
+  def snapshot(self):
+    return Snapshot(self.code.copy(), self.pc, self.relative_base,
+                    tuple(self.inputs), tuple(self.outputs), self.halted)
+
+  def restore(self, snapshot):
+    # copy again so the same snapshot can be restored many times
+    self.code = snapshot.memory.copy()
+    self.pc = snapshot.pc
+    self.relative_base = snapshot.relative_base
+    self.inputs = deque(snapshot.inputs)
+    self.outputs = deque(snapshot.outputs)
+    self.halted = snapshot.halted
+    # blocks were compiled against the memory being replaced
+    self.blocks = {}
+
+  def fork(self):
+    ''' Independent copy of the running program, including pending I/O.
+    The on_input and trace callbacks stay with the original, output is
+    shared '''
+    clone = copy.copy(self)
+    clone.code = self.code.copy()
+    clone.inputs = deque(self.inputs)
+    clone.outputs = deque(self.outputs)
+    # decoded entries are checked against the instruction word on every use
+    # and stay shared, blocks are dropped when this memory is overwritten so
+    # each program keeps its own
+    clone.blocks = dict(self.blocks)
+    clone.on_input = None
+    clone.trace = None
+    clone.trace_block = None
+    # a running stream() belongs to the original only
+    clone.pause_on_output = False
+    return clone
 
   def exec_standalone(self, initial_input):
-    old_stdin = sys.stdin
+    # text mode: whitespace separated inputs, one output per line
     if initial_input:
-      sys.stdin = StringIO(f"{initial_input}\n")
+      self.inputs.extend(int(value) for value in str(initial_input).split())
 
     result = intcode(self)
 
-    #rewind the override
-    self.output.seek(0)
+    output = self.output
+    while self.outputs:
+      outmsg = f"{self.outputs.popleft()}\n"
+      output.write(outmsg)
+      if self.rewind_output:
+        output.seek(output.tell() - len(outmsg))
 
-    sys.stdin = old_stdin
+    #rewind the override
+    output.seek(0)
     return result
   
 
+def log_trace(program, instruction, param_modes):
+  (operation, num_params, opname) = OPERATIONS[instruction % 100]
+  params = [program.code[program.pc+i] for i in range(1, num_params+1)]
+  logging.debug(f"{program.pc}: {opname} {params} {param_modes=} "
+                f"rb={program.relative_base}")
+
+
+def input_ready(program):
+  ''' Fetch the input of a traced INP ahead of it, False if it would suspend,
+  so an INP is traced once it runs rather than each time it is retried '''
+  if program.inputs:
+    return True
+  if program.on_input is not None:
+    value = program.on_input()
+    if value is not None:
+      program.inputs.appendleft(value)
+      return True
+  return False
+
+
 def intcode(program):
   #logging.debug(f"Input code: {program.code}")
+  if program.jit and (program.trace is None or program.trace_block is not None):
+    return intcode_jit(program)
+  if program.trace is not None:
+    return intcode_traced(program)
 
   while True:
-    logging.debug(f"Program counter: {program.pc}")
-    instruction = program.code[program.pc]
-    (opcode, param_modes) = read_instruction(instruction)
     try:
-      (operation, num_params, opname) = OPERATIONS[opcode]
-      result = operation(program, param_modes)
+      (instruction, operation, num_params, param_modes) = decode_instruction(program, program.pc)
     except KeyError:
-      logging.error(f"Invalid operation: {opcode=}")
+      logging.error(f"Invalid operation: {program.code[program.pc]=}")
       return
+    result = operation(program, param_modes)
     if result == RET_CONT:
       program.pc += (num_params+1)
-      logging.debug(f"Updating pc by {num_params+1}")
     elif result == RET_STOP:
       break
+    elif result == RET_PAUSE:
+      program.pc += (num_params+1)
+      break
+
+  return program
+
+
+def intcode_traced(program):
+  trace = program.trace
+  while True:
+    try:
+      (instruction, operation, num_params, param_modes) = decode_instruction(program, program.pc)
+    except KeyError:
+      logging.error(f"Invalid operation: {program.code[program.pc]=}")
+      return
+    if instruction % 100 == 3 and not input_ready(program):
+      break
+    trace(program, instruction, param_modes)
+    result = operation(program, param_modes)
+    if result == RET_CONT:
+      program.pc += (num_params+1)
+    elif result == RET_STOP:
+      break
+    elif result == RET_PAUSE:
+      program.pc += (num_params+1)
+      break
 
   return program
 
 
+# Opcodes a compiled block may contain, with python source templates.
+# Jumps and REL end a block; INP, OUT and HALT are left to the interpreter.
+BLOCK_TEMPLATES = {
+                1: "{2} = {0} + {1}",
+                2: "{2} = {0} * {1}",
+                5: "if {0} != 0: return {1}",
+                6: "if {0} == 0: return {1}",
+                7: "{2} = 1 if {0} < {1} else 0",
+                8: "{2} = 1 if {0} == {1} else 0",
+                9: "program.relative_base = rb + {0}"}
+BLOCK_ENDS = (5, 6, 9)
+# Parameter written to, per opcode
+WRITE_PARAMS = {1: 2, 2: 2, 3: 0, 7: 2, 8: 2}
+
+# source: function, shared by every program with the same code. Bounded,
+# the oldest blocks are dropped first
+COMPILED_BLOCKS = {}
+COMPILED_BLOCKS_LIMIT = 4096
+
+def compile_block(memory, address):
+  ''' Compile the basic block at address, returns (end, words, function)
+  or None if the first instruction has to be interpreted '''
+  statements = []
+  rel_offsets = []
+  rel_reads = []
+  rel_writes = []
+  static_reads = []
+  static_writes = []
+  pos = address
+  while True:
+    instruction = memory[pos]
+    opcode = instruction % 100
+    if opcode not in BLOCK_TEMPLATES:
+      break
+    num_params = OPERATIONS[opcode][1]
+    (_, param_modes) = read_instruction(instruction)
+    write_param = WRITE_PARAMS.get(opcode)
+    operands = []
+    reads = []
+    for i, mode in enumerate(param_modes):
+      param = memory[pos+i+1]
+      if mode == 0:
+        if param < 0:
+          break
+        operands.append(f"c[{param}]")
+        if i != write_param:
+          reads.append(param)
+      elif mode == 1 and i != write_param:
+        operands.append(repr(param))
+      elif mode == 2:
+        operands.append(f"c[rb+{param}]")
+        rel_offsets.append(param)
+        if i == write_param:
+          rel_writes.append(param)
+        else:
+          rel_reads.append(param)
+      else:
+        break
+    else:
+      if any(pos <= target < pos+num_params+1 for target in static_writes):
+        # an earlier write in the block changes this instruction
+        break
+      if write_param is not None and param_modes[write_param] == 0:
+        static_writes.append(memory[pos+write_param+1])
+      static_reads.extend(reads)
+      statements.append(BLOCK_TEMPLATES[opcode].format(*operands))
+      pos += num_params+1
+      if opcode in BLOCK_ENDS:
+        break
+      continue
+    break
+
+  if not statements:
+    return None
+
+  words = [memory[i] for i in range(address, pos)]
+  source = [f"def block(program, c):",
+            f"  rb = program.relative_base"]
+  # grow memory for the writes up front so the block can index the list
+  # directly, reads past the end are left to the interpreter. Memory can be
+  # shorter on a later run (restore, fork, the shared cache), so every bound
+  # is checked in the block rather than at compile time
+  top = max(static_writes, default=-1)
+  unwritten = [param for param in static_reads if param > top]
+  if unwritten:
+    source.append(f"  if {max(unwritten)} >= len(c): return -1")
+  if static_writes:
+    source.append(f"  if {top} >= len(c): program.code[{top}] = 0")
+  if rel_offsets:
+    source.append(f"  if rb+{min(rel_offsets)} < 0: return -1")
+  if rel_writes:
+    source.append(f"  if rb+{max(rel_writes)} >= len(c): program.code[rb+{max(rel_writes)}] = 0")
+    source.append(f"  if rb+{min(rel_writes)} < {pos} and rb+{max(rel_writes)} >= {address}: return -1")
+  if rel_reads:
+    source.append(f"  if rb+{max(rel_reads)} >= len(c): return -1")
+  source.extend(f"  {statement}" for statement in statements)
+  source.append(f"  return {pos}")
+  source = '\n'.join(source)
+
+  function = COMPILED_BLOCKS.get(source)
+  if function is None:
+    namespace = {}
+    exec(source, namespace)
+    if len(COMPILED_BLOCKS) >= COMPILED_BLOCKS_LIMIT:
+      del COMPILED_BLOCKS[next(iter(COMPILED_BLOCKS))]
+    function = COMPILED_BLOCKS[source] = namespace['block']
+  return (pos, words, function)
+
+
+def intcode_jit(program):
+  blocks = program.blocks
+  trace = program.trace
+  trace_block = program.trace_block
+  while True:
+    pc = program.pc
+    try:
+      block = blocks[pc]
+    except KeyError:
+      block = blocks[pc] = compile_block(program.code, pc)
+    if block is not None:
+      (end, words, function) = block
+      cells = program.code.cells
+      if cells[pc:end] == words:
+        new_pc = function(program, cells)
+        if new_pc >= 0:
+          if trace_block is not None:
+            trace_block(program, pc, block, new_pc)
+          program.pc = new_pc
+          continue
+      else:
+        # overwritten by self-modifying code, interpret from now on
+        blocks[pc] = None
+
+    try:
+      (instruction, operation, num_params, param_modes) = decode_instruction(program, pc)
+    except KeyError:
+      logging.error(f"Invalid operation: {program.code[pc]=}")
+      return
+    if trace is not None:
+      if instruction % 100 == 3 and not input_ready(program):
+        break
+      trace(program, instruction, param_modes)
+    result = operation(program, param_modes)
+    if result == RET_CONT:
+      program.pc += (num_params+1)
+    elif result == RET_STOP:
+      break
+    elif result == RET_PAUSE:
+      program.pc += (num_params+1)
+      break
+
+  return program
+
+
+# Largest magnitude a batched SUM/MUL operand or result may reach in int64
+BATCH_LIMIT = 2**62
+# HALT is left to the scalar path, which also flags the program halted
+BATCH_OPCODES = (1, 2, 3, 4, 5, 6, 7, 8, 9)
+
+def intcode_batch(programs, min_group=32, headroom=256):
+  ''' Run many programs until they halt or starve for input.
+  Programs at the same pc with the same instruction advance together over a
+  shared numpy memory matrix. Rows that diverge into groups smaller than
+  min_group, leave the matrix, risk int64 overflow, starve for input or halt
+  carry on in the scalar intcode() '''
+  # imported here, numpy takes longer to load than most programs take to
+  # run; without it batched programs run one by one
+  try:
+    import numpy as np
+  except ImportError:
+    np = None
+  batched = []
+  rows = []
+  for program in programs:
+    if np is None or program.trace or program.jit or program.pause_on_output:
+      intcode(program)
+      continue
+    try:
+      rows.append(np.array(program.code.cells, dtype=np.int64))
+    except OverflowError:
+      intcode(program)
+      continue
+    batched.append(program)
+  if not batched:
+    return programs
+
+  width = max(len(row) for row in rows) + headroom
+  memory = np.zeros((len(batched), width), dtype=np.int64)
+  for i, row in enumerate(rows):
+    memory[i, :len(row)] = row
+  lengths = np.array([len(row) for row in rows], dtype=np.int64)
+  pcs = np.array([program.pc for program in batched], dtype=np.int64)
+  rbs = np.array([program.relative_base for program in batched], dtype=np.int64)
+  active = np.ones(len(batched), dtype=bool)
+  live = np.flatnonzero(active)
+  # instruction: (opcode, num_params, param_modes, write_param)
+  decoded = {}
+  # whether every live row is known to be at the same pc
+  converged = False
+
+  def release(group):
+    # write the rows back into their programs and continue them scalar
+    for row in group:
+      program = batched[row]
+      program.code.cells = memory[row, :lengths[row]].tolist()
+      program.pc = int(pcs[row])
+      program.relative_base = int(rbs[row])
+      active[row] = False
+      intcode(program)
+    return np.flatnonzero(active)
+
+  while len(live):
+    if converged:
+      group = live
+    else:
+      live_pcs = pcs[live]
+      if (live_pcs == live_pcs[0]).all():
+        group = live
+      else:
+        (values, counts) = np.unique(live_pcs, return_counts=True)
+        group = live[live_pcs == values[counts.argmax()]]
+    converged = False
+    pc = int(pcs[group[0]])
+    if pc + 4 > width:
+      live = release(group)
+      continue
+    words = memory[group, pc]
+    if not (words == words[0]).all():
+      (values, counts) = np.unique(words, return_counts=True)
+      group = group[words == values[counts.argmax()]]
+    if len(group) < min_group:
+      # diverged too far to be worth batching
+      release(live)
+      break
+
+    instruction = int(memory[group[0], pc])
+    if instruction not in decoded:
+      opcode = instruction % 100
+      if opcode not in BATCH_OPCODES:
+        # HALT, invalid opcodes and the like
+        live = release(group)
+        continue
+      (_, param_modes) = read_instruction(instruction)
+      write_param = WRITE_PARAMS.get(opcode)
+      if write_param is not None and param_modes[write_param] == 1:
+        live = release(group)
+        continue
+      decoded[instruction] = (opcode, OPERATIONS[opcode][1], param_modes, write_param)
+    (opcode, num_params, param_modes, write_param) = decoded[instruction]
+    uniform = len(group) == len(live)
+
+    # resolve addresses, rows reaching outside the matrix go scalar
+    params = memory[group, pc+1:pc+1+num_params]
+    addresses = []
+    outside = np.zeros(len(group), dtype=bool)
+    for i, mode in enumerate(param_modes):
+      if mode == 1:
+        addresses.append(None)
+        continue
+      address = params[:, i] + rbs[group] if mode == 2 else params[:, i]
+      outside |= (address < 0) | (address >= width)
+      addresses.append(address)
+    if outside.any():
+      live = release(group[outside])
+      uniform = False
+      keep = ~outside
+      group = group[keep]
+      params = params[keep]
+      addresses = [a if a is None else a[keep] for a in addresses]
+      if not len(group):
+        continue
+
+    values = [params[:, i] if address is None else memory[group, address]
+              for i, address in enumerate(addresses)]
+
+    if opcode in (1, 2):
+      (a, b) = (values[0], values[1])
+      if opcode == 1:
+        unsafe = (np.abs(a) >= BATCH_LIMIT) | (np.abs(b) >= BATCH_LIMIT)
+      else:
+        unsafe = np.abs(a.astype(float)) * np.abs(b.astype(float)) >= BATCH_LIMIT
+      if unsafe.any():
+        live = release(group[unsafe])
+        uniform = False
+        keep = ~unsafe
+        (group, a, b) = (group[keep], a[keep], b[keep])
+        addresses[2] = addresses[2][keep]
+      result = a + b if opcode == 1 else a * b
+    elif opcode in (7, 8):
+      (a, b) = (values[0], values[1])
+      result = (a < b if opcode == 7 else a == b).astype(np.int64)
+    elif opcode in (5, 6):
+      jump = values[0] != 0 if opcode == 5 else values[0] == 0
+      pcs[group] = np.where(jump, values[1], pc + 3)
+      continue
+    elif opcode == 9:
+      rbs[group] += values[0]
+      pcs[group] += 2
+      converged = uniform
+      continue
+    elif opcode == 4:
+      for row, value in zip(group, values[0].tolist()):
+        batched[row].outputs.append(value)
+      pcs[group] += 2
+      converged = uniform
+      continue
+    else:
+      # INP takes queued inputs, anything else is up to the scalar path
+      fed = np.array([bool(batched[row].inputs) for row in group])
+      if not fed.all():
+        live = release(group[~fed])
+        uniform = False
+        group = group[fed]
+        addresses[0] = addresses[0][fed]
+      result = np.array([batched[row].inputs.popleft() for row in group],
+                        dtype=object)
+      if len(result) and (np.abs(result) >= BATCH_LIMIT).any():
+        # put them back for the scalar path to read
+        for row, value in zip(group, result):
+          batched[row].inputs.appendleft(value)
+        live = release(group)
+        continue
+      result = result.astype(np.int64)
+
+    target = addresses[write_param]
+    memory[group, target] = result
+    lengths[group] = np.maximum(lengths[group], target + 1)
+    pcs[group] += num_params + 1
+    converged = uniform
+
+  return programs
+
+
 def standalone(program, initial_input, stdout_override):
   program.output = stdout_override
   return program.exec_standalone(initial_input)
@@ -275,19 +828,225 @@ def operate(memory, noun, verb):
   opcodes[2] = verb
   program = Program(opcodes)
   intcode(program)
-  result = opcodes[0]
-  logging.info(f"{result=}")
-  return result
-
-
-def find_result(target, code):
-  possible_inputs = product(range(100), repeat=2)
-  for noun, verb in possible_inputs:
-    result = operate(code, noun, verb)
-    if result == target:
-      logging.info(f"{target=} reached with {noun=},{verb=}")
-      logging.info(f"Answer: {100*noun+verb}")
-      return 100*noun+verb
+  return opcodes[0]
+
+
+# Symbolic values are affine tuples (constant, noun coefficient, verb
+# coefficient), plain ints stay concrete. UNKNOWN marks values that are not
+# affine, which is only fatal once they are used.
+NOUN = (0, 1, 0)
+VERB = (0, 0, 1)
+UNKNOWN = object()
+
+def affine(value):
+  if isinstance(value, int):
+    return (value, 0, 0)
+  return value
+
+
+def affine_add(a, b):
+  if a is UNKNOWN or b is UNKNOWN:
+    return UNKNOWN
+  if isinstance(a, int) and isinstance(b, int):
+    return a + b
+  return affine_normalize(tuple(x + y for x, y in zip(affine(a), affine(b))))
+
+
+def affine_mul(a, b):
+  if a is UNKNOWN or b is UNKNOWN:
+    return UNKNOWN
+  if isinstance(a, int) and isinstance(b, int):
+    return a * b
+  if isinstance(a, int):
+    (a, b) = (b, a)
+  if not isinstance(b, int):
+    # noun*verb and the like are not affine
+    return UNKNOWN
+  return affine_normalize(tuple(x * b for x in a))
+
+
+def affine_normalize(value):
+  if value[1] == 0 and value[2] == 0:
+    return value[0]
+  return value
+
+
+def affine_result(code):
+  ''' Run code once with noun and verb (code[1], code[2]) left symbolic.
+  Returns code[0] as an affine tuple, or None when the program branches on
+  symbolic values, writes through symbolic addresses or code[0] itself is
+  not affine '''
+  memory = dict(enumerate(code))
+  memory[1] = NOUN
+  memory[2] = VERB
+  pc = 0
+  rb = 0
+  while True:
+    instruction = memory.get(pc, 0)
+    if not isinstance(instruction, int):
+      return None
+    opcode = instruction % 100
+    if opcode == 99:
+      break
+    if opcode not in (1, 2, 5, 6, 7, 8, 9):
+      # no I/O in a noun/verb search, invalid opcodes end up here too
+      return None
+    num_params = OPERATIONS[opcode][1]
+    (_, param_modes) = read_instruction(instruction)
+    values = []
+    addresses = []
+    for i, mode in enumerate(param_modes):
+      param = memory.get(pc+i+1, 0)
+      if mode == 1:
+        address = None
+        values.append(param)
+      elif not isinstance(param, int):
+        # reading through a symbolic address
+        address = UNKNOWN
+        values.append(UNKNOWN)
+      else:
+        address = param if mode == 0 else param + rb
+        if address < 0:
+          return None
+        values.append(memory.get(address, 0))
+      addresses.append(address)
+
+    pc += num_params+1
+    if opcode in (5, 6, 9):
+      if not all(isinstance(value, int) for value in values):
+        return None
+      if opcode == 9:
+        rb += values[0]
+      elif (values[0] != 0) == (opcode == 5):
+        pc = values[1]
+      continue
+
+    (first, second) = values[:2]
+    if opcode == 1:
+      result = affine_add(first, second)
+    elif opcode == 2:
+      result = affine_mul(first, second)
+    elif isinstance(first, int) and isinstance(second, int):
+      result = int(first < second) if opcode == 7 else int(first == second)
+    else:
+      result = UNKNOWN
+    if addresses[2] is None or addresses[2] is UNKNOWN:
+      return None
+    memory[addresses[2]] = result
+
+  result = memory.get(0, 0)
+  if result is UNKNOWN:
+    return None
+  return affine(result)
+
+
+def solve_affine(target, expression, candidates=None):
+  (constant, noun_coef, verb_coef) = expression
+  if candidates is not None:
+    for noun, verb in candidates:
+      if constant + noun_coef*noun + verb_coef*verb == target:
+        return (noun, verb)
+    return None
+
+  # same order as product(range(100), repeat=2)
+  for noun in range(100):
+    remainder = target - constant - noun_coef*noun
+    if verb_coef == 0:
+      if remainder == 0:
+        return (noun, 0)
+    elif remainder % verb_coef == 0 and 0 <= remainder // verb_coef < 100:
+      return (noun, remainder // verb_coef)
+  return None
+
+
+# base image of a parallel search, set once per worker process
+SEARCH_MEMORY = None
+
+def init_search_worker(memory):
+  global SEARCH_MEMORY
+  SEARCH_MEMORY = memory
+
+
+def search_chunk(target, candidates, memory=None, batch=False):
+  if memory is None:
+    memory = SEARCH_MEMORY
+  if batch:
+    return search_batch(target, candidates, memory)
+  for noun, verb in candidates:
+    if operate(memory, noun, verb) == target:
+      return (noun, verb)
+  return None
+
+
+def search_batch(target, candidates, memory):
+  programs = []
+  for noun, verb in candidates:
+    opcodes = memory.copy()
+    opcodes[1] = noun
+    opcodes[2] = verb
+    programs.append(Program(opcodes))
+  intcode_batch(programs)
+  for (noun, verb), program in zip(candidates, programs):
+    if program.code[0] == target:
+      return (noun, verb)
+  return None
+
+
+def chunked(iterable, size):
+  iterator = iter(iterable)
+  while chunk := list(islice(iterator, size)):
+    yield chunk
+
+
+def brute_force(target, code, workers=1, candidates=None, chunk_size=500,
+                batch=False):
+  if candidates is None:
+    candidates = product(range(100), repeat=2)
+
+  if workers == 1:
+    if batch:
+      # lockstep over chunks, so an early match skips the rest of the search
+      for chunk in chunked(candidates, chunk_size):
+        found = search_batch(target, chunk, code)
+        if found:
+          return found
+      return None
+    return search_chunk(target, candidates, code)
+
+  found = None
+  workers = workers or os.cpu_count()
+  executor = ProcessPoolExecutor(workers, initializer=init_search_worker,
+                                 initargs=(code,))
+  try:
+    chunks = chunked(candidates, chunk_size)
+    pending = deque()
+    while found is None:
+      # keep a bounded window of chunks in flight, collected in order so
+      # the first match is the one the serial search would find
+      for chunk in islice(chunks, 2*workers - len(pending)):
+        pending.append(executor.submit(search_chunk, target, chunk, None, batch))
+      if not pending:
+        break
+      found = pending.popleft().result()
+  finally:
+    executor.shutdown(cancel_futures=True)
+  return found
+
+
+def find_result(target, code, workers=1, candidates=None, chunk_size=500,
+                symbolic=True, batch=False):
+  expression = affine_result(code) if symbolic else None
+  if expression is not None:
+    logging.info(f"code[0] = {expression[0]} + {expression[1]}*noun + {expression[2]}*verb")
+    found = solve_affine(target, expression, candidates)
+  else:
+    found = brute_force(target, code, workers, candidates, chunk_size, batch)
+
+  if found:
+    (noun, verb) = found
+    logging.info(f"{target=} reached with {noun=},{verb=}")
+    logging.info(f"Answer: {100*noun+verb}")
+    return 100*noun+verb
    
 
 if __name__ == "__main__":
@@ -296,4 +1055,7 @@ if __name__ == "__main__":
     #operate(code, 12, 2)
     #find_result(19690720, code)
     program = Program(line)
-    intcode(program)
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+      program.trace = log_trace
+    for out in program.run():
+      print(out)
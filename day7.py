@@ -1,15 +1,15 @@
 #!/usr/bin/env python3
 import logging
 import fileinput
-from itertools import product
-import sys
-import re
-from io import StringIO
+import os
 from itertools import permutations
-from itertools import cycle
+from collections import defaultdict
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
 
-from day2 import standalone
 from day2 import Program
+from day2 import intcode
 
 def main():
   logging.basicConfig(level=logging.INFO)
@@ -21,56 +21,147 @@ def main():
     #evaluate_amplifiers(program, 5, 9)
   
 
-def evaluate_amplifiers(program, min_phase=0, max_phase=4):
-  max_signal = 0
-  max_phase_sequence = None
-  phase_sequences = permutations(range(min_phase, max_phase+1)) 
-  for sequence in phase_sequences:
-    orig_sequence = sequence
-    logging.info(f"Processing {sequence=}")
+class Channel(deque):
+  ''' Output queue of a linked program, each value appended is also queued
+  as input of every target. The program keeps its outputs as with a plain
+  deque, so run(), stream() and fork() work as for unlinked programs '''
+  def __init__(self, targets, values=()):
+    super().__init__(values)
+    self.targets = targets
+
+  def append(self, value):
+    super().append(value)
+    for target in self.targets:
+      target.append(value)
+
+
+def connect(programs, links):
+  ''' Queue the outputs of programs[src] as inputs of programs[dst], for
+  every (src, dst) in links. Links hold on to the inputs queues, a program
+  restored from a snapshot or forked afterwards is not linked '''
+  targets = defaultdict(list)
+  for src, dst in links:
+    targets[src].append(programs[dst].inputs)
+  for src, channels in targets.items():
+    programs[src].outputs = Channel(channels, programs[src].outputs)
+
+
+def run_network(programs):
+  ''' Run connected programs in turn until all halt or none can progress '''
+  progress = True
+  while progress:
+    progress = False
+    for program in programs:
+      if program.halted:
+        continue
+      pc = program.pc
+      pending = len(program.inputs)
+      intcode(program)
+      if program.halted or program.pc != pc or len(program.inputs) != pending:
+        progress = True
+  return programs
+
+
+def run_amplifiers(program, phases, feedback=False, signal=0):
+  amplifiers = [Program(program.code.copy()) for phase in phases]
+  for amplifier, phase in zip(amplifiers, phases):
+    amplifier.inputs.append(phase)
+  amplifiers[0].inputs.append(signal)
+
+  links = [(i, i+1) for i in range(len(amplifiers)-1)]
+  if feedback:
+    links.append((len(amplifiers)-1, 0))
+  connect(amplifiers, links)
+  run_network(amplifiers)
+
+  # in feedback mode this is also the input the first amplifier never read
+  output = amplifiers[-1].outputs
+  return output[-1] if output else None
+
+
+# base image of a parallel search, set once per worker process
+AMPLIFIER_CODE = None
 
+def init_amplifier_worker(code):
+  global AMPLIFIER_CODE
+  AMPLIFIER_CODE = code
+
+
+def search_prefix(prefix, phases, feedback, code=None):
+  ''' Best (signal, sequence) over the permutations of phases that start
+  with prefix '''
+  program = Program(code if code is not None else AMPLIFIER_CODE)
+  rest = tuple(phase for phase in phases if phase not in prefix)
+  if not feedback:
+    cache = {}
     signal = 0
+    for phase in prefix:
+      signal = amplify(program, phase, signal, cache)
+    return search_tree(program, prefix, rest, signal, cache)
+
+  best = (None, None)
+  for tail in permutations(rest):
+    sequence = prefix + tail
+    signal = run_amplifiers(program, sequence, feedback=True)
+    if signal is not None and (best[0] is None or signal > best[0]):
+      best = (signal, sequence)
+  return best
+
+
+def amplify(program, phase, signal, cache):
+  # a single amplifier, its output only depends on phase and input signal
+  key = (phase, signal)
+  if key not in cache:
+    cache[key] = run_amplifiers(program, (phase,), signal=signal)
+  return cache[key]
+
+
+def search_tree(program, prefix, rest, signal, cache):
+  ''' Best (signal, sequence) of a linear chain, walking the tree of phase
+  prefixes so each prefix signal is computed once and shared by its
+  subtree '''
+  if not rest:
+    return (signal, prefix)
+  best = (None, None)
+  for phase in rest:
+    next_signal = amplify(program, phase, signal, cache)
+    if next_signal is None:
+      continue
+    remaining = tuple(p for p in rest if p != phase)
+    result = search_tree(program, prefix + (phase,), remaining, next_signal, cache)
+    if result[0] is not None and (best[0] is None or result[0] > best[0]):
+      best = result
+  return best
+
+
+def search_parallel(program, phases, feedback, workers=None, prefix_length=None):
+  if prefix_length is None:
+    prefix_length = 1 if len(phases) <= 5 else 2
+  workers = workers or os.cpu_count()
+  with ProcessPoolExecutor(workers, initializer=init_amplifier_worker,
+                           initargs=(program.code,)) as executor:
+    futures = [executor.submit(search_prefix, prefix, phases, feedback)
+               for prefix in permutations(phases, prefix_length)]
+    for future in as_completed(futures):
+      yield future.result()
+
+
+def evaluate_amplifiers(program, min_phase=0, max_phase=4, workers=1):
+  max_signal = 0
+  max_phase_sequence = None
+  phases = tuple(range(min_phase, max_phase+1))
+  # phases 5 and up loop the last amplifier back into the first
+  feedback = min_phase > 4
+  if workers == 1:
+    results = (search_prefix((), phases, feedback, program.code),)
+  else:
+    results = search_parallel(program, phases, feedback, workers)
 
-    amplifiers = []
-    for i in range(len(sequence)+1):
-      code_copy = program.code.copy()
-      program_copy = Program(code_copy)
-      amplifiers.append( program_copy )
-
-    if min_phase > 4:
-      # feedback loop mode
-      sequence = cycle(enumerate(sequence))
-    else:
-      sequence = enumerate(sequence)
-
-    for i, (amplifier, phase) in enumerate(sequence):
-      logging.info("*"*12 + f" Amplifier {chr(amplifier+65)}\n")
-      
-      if i < 5:
-        # init with phase
-        logging.info(f"{phase=}")
-        logging.info(f"Input: {phase=}, {signal=}")
-        initial_input = f"{phase}\n{signal}"
-      else:
-        logging.info(f"Input {signal=}")
-        initial_input = f"{signal}"
-
-      out = StringIO()
-      # resume the amplifier at its last pc
-      standalone(amplifiers[amplifier], initial_input, out)
-
-      output = out.read().rstrip()
-      logging.info(f"{output=}")
-      out_match = re.search('(\d+)', output)
-      if out_match:
-        (signal,) = out_match.groups()
-        logging.info(f"{signal=}")
-      else:
-        break
-
-    if int(signal) > max_signal:
-      max_signal = int(signal)
-      max_phase_sequence = list(orig_sequence)
+  for signal, sequence in results:
+    logging.info(f"{sequence=} {signal=}")
+    if signal is not None and signal > max_signal:
+      max_signal = signal
+      max_phase_sequence = list(sequence)
 
   logging.info(f"{max_phase_sequence=}") 
   logging.info(f"{max_signal=}") 
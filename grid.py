@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+# Marks the cells of a chunk that were never set
+UNSET = 255
+
+
+class SparseGrid(object):
+  ''' Unbounded 2D grid of small ints (0-254), stored in square bytearray
+  chunks keyed by chunk coordinate '''
+  def __init__(self, default=0, chunk_bits=5):
+    self.default = default
+    self.chunk_bits = chunk_bits
+    self.chunk_size = 1 << chunk_bits
+    self.mask = self.chunk_size - 1
+    # (chunk x, chunk y): row-major bytearray of chunk_size**2 cells
+    self.chunks = {}
+    self.painted = 0
+    # (min_x, min_y, max_x, max_y) of the cells set, None while empty
+    self.bounds = None
+
+  def locate(self, x, y):
+    ''' Chunk key and offset within the chunk of a cell '''
+    bits = self.chunk_bits
+    mask = self.mask
+    return ((x >> bits, y >> bits), ((y & mask) << bits) | (x & mask))
+
+  def __getitem__(self, location):
+    (key, offset) = self.locate(*location)
+    chunk = self.chunks.get(key)
+    if chunk is None:
+      return self.default
+    value = chunk[offset]
+    return self.default if value == UNSET else value
+
+  def __setitem__(self, location, value):
+    if not 0 <= value < UNSET:
+      raise ValueError(f"{value} does not fit in a grid cell")
+    (x, y) = location
+    (key, offset) = self.locate(x, y)
+    chunk = self.chunks.get(key)
+    if chunk is None:
+      chunk = self.chunks[key] = bytearray([UNSET]) * (self.chunk_size ** 2)
+    if chunk[offset] == UNSET:
+      self.painted += 1
+      if self.bounds is None:
+        self.bounds = (x, y, x, y)
+      else:
+        (min_x, min_y, max_x, max_y) = self.bounds
+        self.bounds = (min(min_x, x), min(min_y, y), max(max_x, x), max(max_y, y))
+    chunk[offset] = value
+
+  def __contains__(self, location):
+    (key, offset) = self.locate(*location)
+    chunk = self.chunks.get(key)
+    return chunk is not None and chunk[offset] != UNSET
+
+  def __len__(self):
+    return self.painted
+
+  def items(self):
+    ''' ((x, y), value) of the cells set, chunk by chunk '''
+    bits = self.chunk_bits
+    mask = self.mask
+    for (cx, cy), chunk in self.chunks.items():
+      for offset, value in enumerate(chunk):
+        if value != UNSET:
+          yield (((cx << bits) | (offset & mask), (cy << bits) | (offset >> bits)), value)
+
+  def render(self, palette, window=None, y_up=False):
+    ''' Text rows over window (min_x, min_y, max_x, max_y), the bounding box
+    by default. palette[value] is the character drawn for value, unset cells
+    are drawn as the default value. y_up puts the largest y on top '''
+    if window is None:
+      window = self.bounds
+    if window is None:
+      return ''
+    (min_x, min_y, max_x, max_y) = window
+
+    # translation table from cell values to characters
+    table = bytearray(palette[self.default].encode()) * 256
+    for value, char in enumerate(palette):
+      table[value] = ord(char)
+    table = bytes(table)
+
+    bits = self.chunk_bits
+    mask = self.mask
+    size = self.chunk_size
+    blank = bytes([table[self.default]]) * size
+    columns = range(min_x >> bits, (max_x >> bits) + 1)
+    skip = min_x - (columns[0] << bits)
+    width = max_x - min_x + 1
+    if y_up:
+      ys = range(max_y, min_y - 1, -1)
+    else:
+      ys = range(min_y, max_y + 1)
+
+    rows = []
+    for y in ys:
+      cy = y >> bits
+      start = (y & mask) << bits
+      parts = []
+      for cx in columns:
+        chunk = self.chunks.get((cx, cy))
+        if chunk is None:
+          parts.append(blank)
+        else:
+          parts.append(chunk[start:start+size].translate(table))
+      rows.append(b''.join(parts)[skip:skip+width].decode())
+    return '\n'.join(rows)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import logging
+import sys
+from collections import Counter
+
+from day2 import Program
+from day2 import OPERATIONS
+from day2 import WRITE_PARAMS
+from day2 import read_instruction
+
+JUMPS = (5, 6)
+
+
+class Profiler(object):
+  ''' Intcode profiler, installed as the trace hooks of one or more programs.
+  With jit, compiled blocks are counted once per run and only interpreted
+  instructions feed the read/write heatmap, which heatmap=False turns off '''
+  def __init__(self, heatmap=True):
+    self.heatmap = heatmap
+    # (address, instruction) executed, per opcode/address/mode counts derive
+    # from it when exporting
+    self.sites = Counter()
+    # compiled block runs, keyed by the block's (address, instruction) sites
+    self.block_runs = Counter()
+    self.block_sites = {}
+    self.jumps = Counter()
+    self.reads = Counter()
+    self.writes = Counter()
+    # address of the last jump instruction per program, to spot taken jumps
+    self.pending_jump = {}
+
+  def attach(self, program):
+    program.trace = self
+    program.trace_block = self.block
+    return program
+
+  def detach(self, program):
+    program.trace = None
+    program.trace_block = None
+    self.pending_jump.pop(id(program), None)
+
+  def block(self, program, address, block, next_pc):
+    sites = self.block_sites.get(id(block))
+    if sites is None:
+      # keep the block alive so its id is not reused
+      sites = self.decode_block(address, block[1])
+      self.block_sites[id(block)] = (block, sites)
+    else:
+      sites = sites[1]
+    self.block_runs[sites] += 1
+
+    jump = self.pending_jump.pop(id(program), None)
+    if jump is not None and address != jump + 3:
+      self.jumps[(jump, address)] += 1
+    (last, instruction) = sites[-1]
+    if instruction % 100 in JUMPS and next_pc != block[0]:
+      self.jumps[(last, next_pc)] += 1
+
+  @staticmethod
+  def decode_block(address, words):
+    sites = []
+    offset = 0
+    while offset < len(words):
+      instruction = words[offset]
+      sites.append((address + offset, instruction))
+      offset += OPERATIONS[instruction % 100][1] + 1
+    return tuple(sites)
+
+  def __call__(self, program, instruction, param_modes):
+    pc = program.pc
+    opcode = instruction % 100
+    self.sites[(pc, instruction)] += 1
+
+    jump = self.pending_jump.pop(id(program), None)
+    if jump is not None and pc != jump + 3:
+      self.jumps[(jump, pc)] += 1
+    if opcode in JUMPS:
+      self.pending_jump[id(program)] = pc
+
+    if not self.heatmap:
+      return
+    code = program.code
+    write_param = WRITE_PARAMS.get(opcode)
+    for i, mode in enumerate(param_modes):
+      if mode == 1:
+        continue
+      address = code[pc+i+1]
+      if mode == 2:
+        address += program.relative_base
+      if i == write_param:
+        self.writes[address] += 1
+      else:
+        self.reads[address] += 1
+
+  def executed(self):
+    ''' Execution count per (address, instruction), interpreted and compiled '''
+    sites = Counter(self.sites)
+    for block, runs in self.block_runs.items():
+      for site in block:
+        sites[site] += runs
+    return sites
+
+  def counts(self):
+    ''' Execution counts per opcode name, address and opcode with modes '''
+    opcodes = Counter()
+    addresses = Counter()
+    modes = Counter()
+    for (address, instruction), count in self.executed().items():
+      opname = OPERATIONS[instruction % 100][2]
+      (_, param_modes) = read_instruction(instruction)
+      opcodes[opname] += count
+      addresses[address] += count
+      modes[f"{opname} {','.join(map(str, param_modes))}"] += count
+    return (opcodes, addresses, modes)
+
+  def to_json(self):
+    (opcodes, addresses, modes) = self.counts()
+    return {
+      'instructions': sum(self.executed().values()),
+      'opcodes': dict(opcodes.most_common()),
+      'addresses': {str(a): n for a, n in addresses.most_common()},
+      'modes': dict(modes.most_common()),
+      'jumps': {f"{src}->{dst}": n for (src, dst), n in self.jumps.most_common()},
+      'reads': {str(a): n for a, n in self.reads.most_common()},
+      'writes': {str(a): n for a, n in self.writes.most_common()},
+    }
+
+  def write_json(self, out):
+    json.dump(self.to_json(), out, indent=2)
+
+  def folded(self):
+    ''' Stacks in the folded format taken by flamegraph.pl/speedscope '''
+    lines = []
+    for (address, instruction), count in self.executed().most_common():
+      opname = OPERATIONS[instruction % 100][2]
+      lines.append(f"intcode;{opname};{address}:{instruction} {count}")
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Profile an Intcode program')
+  parser.add_argument('program', help='file with the intcode program')
+  parser.add_argument('inputs', nargs='*', type=int)
+  parser.add_argument('--folded', action='store_true',
+                      help='print folded stacks instead of json')
+  parser.add_argument('--jit', action='store_true',
+                      help='profile on the compiled tier')
+  parser.add_argument('--no-heatmap', action='store_true',
+                      help='skip the per-address read/write counts')
+  args = parser.parse_args()
+  logging.basicConfig(level=logging.INFO)
+
+  with open(args.program) as inp:
+    program = Program(inp.read())
+  program.jit = args.jit
+  profiler = Profiler(heatmap=not args.no_heatmap)
+  profiler.attach(program)
+  outputs = program.run(*args.inputs)
+  logging.info(f"{outputs=}")
+  if args.folded:
+    sys.stdout.write(profiler.folded())
+  else:
+    profiler.write_json(sys.stdout)
+
+
+if __name__ == '__main__':
+  main()
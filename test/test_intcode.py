@@ -1,11 +1,42 @@
+import json
 import unittest
 from io import StringIO
+from itertools import permutations
 
 from test.lib import TestDay
 
 from day2 import intcode
 from day2 import Program
 from day2 import find_result
+from day2 import operate
+from day2 import affine_result
+from day2 import Memory
+from day2 import intcode_batch
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+
+class TestMemory(TestDay):
+  def test_grow(self):
+    memory = Memory([1, 2, 3])
+    # unwritten cells read as zero without growing
+    self.assertEqual(memory[10], 0)
+    self.assertEqual(len(memory), 3)
+    memory[10] = 7
+    self.assertEqual(len(memory), 11)
+    self.assertEqual(memory[10], 7)
+    self.assertEqual(memory[5], 0)
+
+  def test_copy(self):
+    memory = Memory([1, 2, 3])
+    clone = memory.copy()
+    clone[0] = 9
+    clone[5] = 1
+    self.assertEqual(list(memory), [1, 2, 3])
+    self.assertEqual(list(clone), [9, 2, 3, 0, 0, 1])
 
 
 class TestDay2(TestDay):
@@ -36,7 +67,72 @@ class TestDay2(TestDay):
     # Test 1+1 into pos 4, which makes 5*6 into pos 0
     self.assertEqual(program.code[0], 30)
 
-  # 
+  def test_trace(self):
+    program = Program('1101,2,3,0,99')
+    executed = []
+    program.trace = lambda p, instruction, modes: executed.append((p.pc, instruction, modes))
+    intcode(program)
+    self.assertEqual(program.code[0], 5)
+    self.assertEqual(executed, [(0, 1101, (1, 1, 0)), (4, 99, ())])
+
+  def test_self_modify(self):
+    # 1+1 into pos 20, overwrite pos 0 with HALT and jump back to it
+    program = Program('1101,1,1,20,1101,0,99,0,1105,1,0')
+    intcode(program)
+    self.assertEqual(program.code[20], 2)
+    self.assertEqual(program.code[0], 99)
+
+  def test_jit_self_modify(self):
+    # first instruction turns the second into HALT within the same block
+    program = Program('1101,0,99,4,1101,1,1,20,99')
+    program.jit = True
+    intcode(program)
+    self.assertEqual(program.code[4], 99)
+    self.assertEqual(program.code[20], 0)
+
+    program = Program('1101,1,1,20,1101,0,99,0,1105,1,0')
+    program.jit = True
+    intcode(program)
+    self.assertEqual(program.code[20], 2)
+
+  def test_jit_read_past_end(self):
+    # reads past the end give 0 without growing memory, as interpreted
+    for code in ('1,100000000,0,0,4,0,99', '109,100000000,22201,0,0,0,4,0,99'):
+      program = Program(code)
+      program.jit = True
+      interpreted = Program(code)
+      self.assertEqual(program.run(), interpreted.run())
+      self.assertEqual(len(program.code), len(interpreted.code))
+
+  def test_jit_shorter_memory(self):
+    # a block compiled while memory was long runs again on a short copy
+    code = '3,20,1005,20,9,1101,0,0,50,1001,40,1,30,4,30,1105,1,0'
+    program = Program(code)
+    program.jit = True
+    self.assertEqual(program.run(0), [1])
+    self.assertEqual(program.run(1), [1])
+    short = Program(code)
+    short.jit = True
+    short.blocks = program.blocks
+    interpreted = Program(code)
+    self.assertEqual(short.run(1), interpreted.run(1))
+    self.assertEqual(short.code.cells, interpreted.code.cells)
+
+  def test_jit_cache_bounded(self):
+    import day2
+    limit = day2.COMPILED_BLOCKS_LIMIT
+    day2.COMPILED_BLOCKS_LIMIT = 2
+    try:
+      for value in range(5):
+        program = Program(f'1101,{value},0,0,99')
+        program.jit = True
+        program.run()
+        self.assertEqual(program.code[0], value)
+      self.assertLessEqual(len(day2.COMPILED_BLOCKS), 2)
+    finally:
+      day2.COMPILED_BLOCKS_LIMIT = limit
+
+  #
   # Puzzles
   #
   def test_phase1(self):
@@ -53,6 +149,37 @@ class TestDay2(TestDay):
       target = 19690720
       answer = find_result(target, program.code)
       self.assertEqual(answer, 4112)
+
+  def test_phase2_parallel(self):
+    with open(f'{self.input_loc}/day2') as inp:
+      program = Program(inp.read())
+      target = 19690720
+      answer = find_result(target, program.code, workers=2, chunk_size=100,
+                           symbolic=False)
+      self.assertEqual(answer, 4112)
+
+  def test_phase2_symbolic(self):
+    with open(f'{self.input_loc}/day2') as inp:
+      program = Program(inp.read())
+      # day2 computes code[0] as an affine function of noun and verb
+      (constant, noun_coef, verb_coef) = affine_result(program.code)
+      self.assertEqual(operate(program.code, 12, 2), constant + 12*noun_coef + 2*verb_coef)
+      answer = find_result(19690720, program.code, symbolic=True)
+      self.assertEqual(answer, 4112)
+
+  @unittest.skipIf(np is None, 'numpy not installed')
+  def test_phase2_batch(self):
+    with open(f'{self.input_loc}/day2') as inp:
+      program = Program(inp.read())
+      answer = find_result(19690720, program.code, symbolic=False, batch=True)
+      self.assertEqual(answer, 4112)
+
+  def test_symbolic_fallback(self):
+    # multiplies noun by verb into pos 0, not affine
+    code = '1102,0,0,0,99'
+    self.assertIsNone(affine_result(Program(code).code))
+    program = Program(code)
+    self.assertEqual(find_result(42, program.code), 142)
     
 from day2 import standalone
 class TestDay5(TestDay):
@@ -171,6 +298,28 @@ class TestDay5(TestDay):
     standalone(program, '80', output)
     self.assertEqual(output.read().rstrip(), '1001')
 
+  @unittest.skipIf(np is None, 'numpy not installed')
+  def test_batch_diverge(self):
+    code = ('3,21,1008,21,8,20,1005,20,22,107,8,21,20,1006,20,31,'
+           '1106,0,36,98,0,0,1002,21,125,20,4,20,1105,1,46,104,'
+           '999,1105,1,46,1101,1000,1,20,4,20,1105,1,46,98,99')
+    programs = [Program(code) for value in range(12)]
+    for value, program in enumerate(programs):
+      program.inputs.append(value)
+    # the programs split three ways on the comparison, with a group size
+    # of 2 some of them keep running batched after the split
+    intcode_batch(programs, min_group=2)
+    self.assertEqual([list(program.outputs) for program in programs],
+                     [[999]]*8 + [[1000]] + [[1001]]*3)
+    self.assertTrue(all(program.halted for program in programs))
+
+  def test_extra_mode_digits(self):
+    # mode digits past the last parameter are ignored, as by intcode()
+    programs = [Program('1001105,1,4,0,99') for i in range(40)]
+    intcode_batch(programs)
+    self.assertTrue(all(program.halted for program in programs))
+    self.assertEqual({program.pc for program in programs}, {4})
+
 
   # Puzzles
   def test_phase1(self):
@@ -212,6 +361,96 @@ class TestDay9(TestDay):
     self.assertEqual(len(output.read().rstrip()), 16)
 
 
+  def test_run_suspend(self):
+    # echo every input, suspending once inputs run dry
+    program = Program('3,100,4,100,1105,1,0')
+    self.assertEqual(program.run(1, -2), [1, -2])
+    self.assertFalse(program.halted)
+    self.assertEqual(program.run(3), [3])
+
+  def test_stream(self):
+    program = Program('3,100,4,100,1105,1,0')
+    echo = program.stream()
+    # waiting on input
+    self.assertIsNone(next(echo))
+    self.assertEqual(echo.send(5), 5)
+    self.assertIsNone(next(echo))
+    self.assertEqual(echo.send(-7), -7)
+
+  def test_fork(self):
+    # running sum of the inputs
+    program = Program('3,100,1,100,101,101,4,101,1105,1,0')
+    self.assertEqual(program.run(1, 2), [1, 3])
+    clone = program.fork()
+    self.assertEqual(clone.run(10), [13])
+    self.assertEqual(program.run(5), [8])
+    self.assertEqual(clone.run(1), [14])
+
+    # callbacks stay with the original, the clone suspends on input
+    program.on_input = lambda: 100
+    program.trace = lambda p, instruction, modes: None
+    clone = program.fork()
+    self.assertIsNone(clone.on_input)
+    self.assertIsNone(clone.trace)
+    self.assertEqual(clone.run(), [])
+    clone.code[100] = 0
+    self.assertEqual(program.code[100], 5)
+
+  def test_jit_fork_restore(self):
+    # compiled blocks never run against the shorter memory of an older state
+    code = '3,20,1005,20,9,1101,0,0,50,1001,40,1,30,4,30,1105,1,0'
+    program = Program(code)
+    program.jit = True
+    clone = program.fork()
+    snapshot = program.snapshot()
+    self.assertEqual(program.run(0), [1])
+    self.assertEqual(program.run(1), [1])
+    self.assertIsNot(clone.blocks, program.blocks)
+    self.assertEqual(clone.run(1), [1])
+    program.restore(snapshot)
+    self.assertEqual(program.blocks, {})
+    self.assertEqual(program.run(1), [1])
+    self.assertEqual(len(program.code), len(clone.code))
+
+  def test_snapshot_restore(self):
+    program = Program('3,100,1,100,101,101,4,101,1105,1,0')
+    program.run(4)
+    snapshot = program.snapshot()
+    self.assertEqual(program.run(1), [5])
+    program.restore(snapshot)
+    self.assertEqual(program.run(2), [6])
+    program.restore(snapshot)
+    self.assertEqual(program.run(3), [7])
+
+  def test_records(self):
+    program = Program('3,11,104,1,4,11,104,2,104,3,99,0')
+    robot = program.records(2)
+    self.assertIsNone(next(robot))
+    self.assertEqual(robot.send(7), (1, 7))
+    self.assertEqual(list(robot), [(2, 3)])
+
+  def test_lines(self):
+    program = Program('104,104,104,105,104,10,104,200,3,17,4,17,104,10,99,0,0,0')
+    terminal = program.lines()
+    self.assertEqual(next(terminal), 'hi')
+    self.assertEqual(next(terminal), 200)
+    self.assertIsNone(next(terminal))
+    self.assertEqual(terminal.send('A'), 'A')
+    self.assertEqual(list(terminal), [])
+
+    # negative values are not ASCII either
+    self.assertEqual(list(Program('104,-1,104,10,99').lines()), [-1, ''])
+
+  def test_stream_halt(self):
+    program = Program('104,1,104,2,99')
+    self.assertEqual(list(program.stream()), [1, 2])
+    self.assertTrue(program.halted)
+
+  def test_no_input(self):
+    output = StringIO()
+    standalone(Program('104,7,99'), None, output)
+    self.assertEqual(output.read().rstrip(), '7')
+
   def test_largenum(self):
     code = '104,1125899906842624,99'
     program = Program(code)
@@ -236,8 +475,17 @@ class TestDay9(TestDay):
       standalone(program, '2', output)
       self.assertEqual(output.read().rstrip(), '58534')
 
+  def test_phase2_jit(self):
+    with open(f'{self.input_loc}/day9') as inp:
+      program = Program(inp.read())
+      program.jit = True
+      self.assertEqual(program.run(2), [58534])
+
 
 from day7 import evaluate_amplifiers
+from day7 import run_amplifiers
+from day7 import connect
+from day7 import run_network
 class TestDay7(TestDay):
 
   # Samples
@@ -259,6 +507,40 @@ class TestDay7(TestDay):
     self.assertEqual(max_signal, 65210)
 
 
+  def test_long_chain(self):
+    # each amplifier outputs input*10 + phase
+    program = Program('3,15,3,16,1002,16,10,16,1,16,15,15,4,15,99,0,0')
+    self.assertEqual(run_amplifiers(program, [1, 2, 3, 4, 5, 6, 7]), 1234567)
+
+  def test_fanout(self):
+    # 0 feeds both 1 and 2, which both feed 3
+    code = '3,15,3,16,1002,16,10,16,1,16,15,15,4,15,99,0,0'
+    programs = [Program(code) for i in range(4)]
+    for program, phase in zip(programs, [1, 2, 3, 4]):
+      program.inputs.append(phase)
+    programs[0].inputs.append(0)
+    connect(programs, [(0, 1), (0, 2), (1, 3), (2, 3)])
+    run_network(programs)
+    self.assertEqual([p.halted for p in programs], [True] * 4)
+    # 3 reads its phase and the first signal to arrive, from 1
+    self.assertEqual(list(programs[3].outputs), [124])
+    self.assertEqual(list(programs[3].inputs), [13])
+
+  def test_linked_run(self):
+    code = '3,15,3,16,1002,16,10,16,1,16,15,15,4,15,99,0,0'
+    programs = [Program(code) for i in range(3)]
+    for program, phase in zip(programs, [1, 2, 3]):
+      program.inputs.append(phase)
+    connect(programs, [(0, 1), (0, 2)])
+    clone = programs[0].fork()
+    # driving a linked program by hand leaves its targets' inputs queued
+    self.assertEqual(programs[0].run(0), [1])
+    self.assertEqual(list(programs[1].inputs), [2, 1])
+    self.assertEqual(list(programs[2].inputs), [3, 1])
+    # the fork is not linked
+    self.assertEqual(clone.run(5), [51])
+    self.assertEqual(list(programs[1].inputs), [2, 1])
+
   # Amplifier Phases 5-9
   def test_139629729(self):
     program = Program('3,26,1001,26,-4,26,3,27,1002,27,2,27,1,27,26,27,4,27,'
@@ -285,6 +567,23 @@ class TestDay7(TestDay):
       program = Program(inp.read())
       max_signal = evaluate_amplifiers(program, min_phase=5, max_phase=9)
       self.assertEqual(max_signal, 17279674)
+
+  def test_prefix_tree(self):
+    with open(f'{self.input_loc}/day7') as inp:
+      program = Program(inp.read())
+      # six amplifier chain, against running every permutation in full
+      expected = max(run_amplifiers(program, sequence)
+                     for sequence in permutations(range(6)))
+      max_signal = evaluate_amplifiers(program, min_phase=0, max_phase=5)
+      self.assertEqual(max_signal, expected)
+
+  def test_parallel(self):
+    with open(f'{self.input_loc}/day7') as inp:
+      program = Program(inp.read())
+      max_signal = evaluate_amplifiers(program, min_phase=0, max_phase=4, workers=2)
+      self.assertEqual(max_signal, 87138)
+      max_signal = evaluate_amplifiers(program, min_phase=5, max_phase=9, workers=2)
+      self.assertEqual(max_signal, 17279674)
       
 
 from day11 import hull_painting
@@ -309,3 +608,272 @@ class TestDay11(TestDay):
       (painted,x,y) = hull_painting(program, 1)
       render = render_panels(painted, x, y)
       self.assertTrue(expected in render)
+
+
+from grid import SparseGrid
+class TestSparseGrid(TestDay):
+  def test_cells(self):
+    grid = SparseGrid(chunk_bits=2)
+    self.assertIsNone(grid.bounds)
+    grid[(-5, 3)] = 1
+    grid[(2, -1)] = 0
+    grid[(2, -1)] = 1
+    self.assertEqual(len(grid), 2)
+    self.assertEqual(grid.bounds, (-5, -1, 2, 3))
+    self.assertEqual(grid[(-5, 3)], 1)
+    self.assertEqual(grid[(100, 100)], 0)
+    self.assertIn((2, -1), grid)
+    self.assertNotIn((0, 0), grid)
+    self.assertEqual(sorted(grid.items()), [((-5, 3), 1), ((2, -1), 1)])
+
+  def test_render(self):
+    grid = SparseGrid(chunk_bits=2)
+    grid[(-1, 0)] = 1
+    grid[(5, 1)] = 2
+    self.assertEqual(grid.render('.#o'), '#......\n......o')
+    self.assertEqual(grid.render('.#o', y_up=True), '......o\n#......')
+    self.assertEqual(grid.render('.#o', (0, 0, 1, 0)), '..')
+
+
+from day13 import init_game
+from day13 import run_game
+from day13 import count_tiles
+from day13 import TILE_BLOCK
+from day13 import update_screen
+from day13 import render_game
+from day13 import Renderer
+from day13 import auto_play
+from day13 import evaluate_policies
+from day13 import follow_ball
+from day13 import NoisyFollower
+class TestDay13(TestDay):
+  def test_phase1(self):
+    with open(f'{self.input_loc}/day13') as inp:
+      program = Program(inp.read())
+      screen = init_game(program)
+      self.assertEqual(count_tiles(screen, TILE_BLOCK), 180)
+
+  def test_phase2(self):
+    with open(f'{self.input_loc}/day13') as inp:
+      program = Program(inp.read())
+      screen = {}
+      run_game(program, screen)
+      self.assertEqual(screen[(-1,0)], 8777)
+
+  def test_auto_play(self):
+    with open(f'{self.input_loc}/day13') as inp:
+      program = Program(inp.read())
+      frames = []
+      (score, blocks) = auto_play(program, lambda frame, screen: frames.append(frame), 1000)
+      self.assertEqual((score, blocks), (8777, 0))
+      self.assertEqual(frames[:3], [0, 1000, 2000])
+      self.assertTrue(program.halted)
+
+  def test_policies(self):
+    with open(f'{self.input_loc}/day13') as inp:
+      program = Program(inp.read())
+      policies = [follow_ball, NoisyFollower(3, 0.05)]
+      parallel = evaluate_policies(program, policies, workers=2)
+      self.assertEqual(parallel[0][:3], (8777, 0, 4302))
+      # seeded policies replay the same game in any process
+      serial = evaluate_policies(program, policies, workers=1)
+      self.assertEqual([r[:3] for r in serial], [r[:3] for r in parallel])
+
+  def test_render(self):
+    screen = {}
+    dirty = set()
+    update_screen(screen, [(0,0,1), (2,1,4), (-1,0,12)], dirty)
+    # size is inferred from the tiles, missing ones are empty
+    self.assertEqual(render_game(screen), '%  \n  o\nSCORE: 12\n')
+
+    out = StringIO()
+    renderer = Renderer(out)
+    renderer.draw(screen, dirty)
+    self.assertIn('\x1b[2;3Ho', out.getvalue())
+    self.assertIn('SCORE: 12', out.getvalue())
+
+    # only the changed tile is redrawn the next frame
+    dirty.clear()
+    update_screen(screen, [(0,0,1), (1,1,4), (2,1,0)], dirty)
+    self.assertEqual(dirty, {(1,1), (2,1)})
+    out.seek(0)
+    out.truncate()
+    renderer.draw(screen, dirty)
+    self.assertNotIn('SCORE', out.getvalue())
+    self.assertNotIn('%', out.getvalue())
+
+
+from day15 import RepairDroid
+from day15 import Location
+from day15 import MazeRenderer
+from day15 import MazeGraph
+from day15 import pack, unpack, MOVES
+class TestDay15(TestDay):
+  def test_explore(self):
+    with open(f'{self.input_loc}/day15') as inp:
+      code = inp.read()
+      droid = RepairDroid(code)
+      (system, cost) = droid.explore()
+      self.assertEqual((system.tuple, cost), ((-20, -14), 354))
+      self.assertEqual(droid.graph.flood_time(), 370)
+
+      # the parallel frontier maps the same maze, narrow levels stay serial
+      parallel = RepairDroid(code)
+      self.assertEqual(parallel.explore(workers=2), (system, cost))
+      self.assertEqual(parallel.maze, droid.maze)
+
+      # every level on the pool
+      pooled = RepairDroid(code)
+      self.assertEqual(pooled.explore(workers=2, parallel_frontier=1), (system, cost))
+      self.assertEqual(pooled.maze, droid.maze)
+
+  def test_pack(self):
+    # neighbours of cells far from the origin keep their row
+    for (x, y) in [(0, 0), (40000, -40000), (-70000, 70000)]:
+      key = pack(x, y)
+      neighbors = {unpack(key + offset) for (_, offset) in MOVES}
+      self.assertEqual(neighbors, {(x, y+1), (x, y-1), (x-1, y), (x+1, y)})
+    with self.assertRaises(ValueError):
+      pack(1 << 31, 0)
+
+  def test_renderer(self):
+    with open(f'{self.input_loc}/day15') as inp:
+      code = inp.read()
+      # final map only, sized to the explored area
+      out = StringIO()
+      RepairDroid(code).explore(renderer=MazeRenderer(every=0, out=out))
+      frame = out.getvalue()
+      self.assertEqual(frame.count('\x1b[2J'), 1)
+      rows = frame.split('\x1b[H')[1].split('\x1b[')[0].split('\n')
+      self.assertEqual((len(rows), len(rows[0])), (41, 41))
+      self.assertEqual(frame.count('O'), 1)
+
+      # throttled frames only draw what changed
+      out = StringIO()
+      RepairDroid(code).explore(renderer=MazeRenderer(every=100, out=out))
+      self.assertLess(out.getvalue().count('\x1b[2J'), 20)
+
+  def test_maze_graph(self):
+    # 3x3 open room with a wall in the middle, system in a corner
+    maze = {}
+    for x in range(-1, 4):
+      for y in range(-1, 4):
+        maze[(x,y)] = Location.Type.WALL
+    for x in range(3):
+      for y in range(3):
+        if (x,y) != (1,1):
+          maze[(x,y)] = Location.Type.PATH
+    maze[(2,2)] = Location.Type.SYSTEM
+    graph = MazeGraph.from_maze(maze, (0,0), (2,2))
+    self.assertEqual(graph.distance((0,0), (2,2)), 4)
+    self.assertEqual(graph.distance((0,0), (1,1)), None)
+    self.assertEqual(len(graph.path((0,0), (2,2))), 5)
+    self.assertEqual(sorted(graph.layer((0,0), 2)), [(0,2), (2,0)])
+    self.assertEqual(graph.eccentricity((1,0)), 4)
+    self.assertEqual(graph.flood_time(), 4)
+
+    # nothing is reachable from walls or the padding around the maze
+    self.assertEqual(graph.distance((1,1), (0,1)), None)
+    self.assertEqual(graph.distance((0,1), (1,1)), None)
+    self.assertEqual(graph.distance((4,4), (0,0)), None)
+    self.assertEqual(graph.path((1,1), (0,1)), None)
+    self.assertEqual(graph.layer((1,1), 0), [])
+    self.assertEqual(graph.eccentricity((1,1)), None)
+    with self.assertRaises(KeyError):
+      graph.distance((5,5), (0,0))
+
+    out = StringIO()
+    json.dump(graph.to_json(), out)
+    out.seek(0)
+    loaded = MazeGraph.from_json(json.load(out))
+    self.assertEqual(loaded.cells, graph.cells)
+    self.assertEqual((loaded.start, loaded.system), ((0,0), (2,2)))
+    self.assertEqual(loaded.flood_time(), 4)
+
+
+from day17 import VaccumRobot
+class TestDay17(TestDay):
+  def test_phase1(self):
+    with open(f'{self.input_loc}/day17') as inp:
+      robot = VaccumRobot(inp.read())
+      robot.build_scaffold_view()
+      self.assertEqual(robot.find_intersections(), 3448)
+      self.assertEqual((robot.xposition, robot.yposition), (14, 0))
+
+  def test_walk_path(self):
+    with open(f'{self.input_loc}/day17') as inp:
+      robot = VaccumRobot(inp.read())
+      robot.build_scaffold_view()
+      path = ','.join(str(p) for p in robot.walk_path())
+      # straight through intersections, ends with the last run
+      self.assertEqual(path, 'L,4,L,4,L,6,R,10,L,6,L,4,L,4,L,6,R,10,L,6,L,12,L,6,'
+                             'R,10,L,6,R,8,R,10,L,6,R,8,R,10,L,6,L,4,L,4,L,6,R,10,'
+                             'L,6,R,8,R,10,L,6,L,12,L,6,R,10,L,6,R,8,R,10,L,6,L,12,'
+                             'L,6,R,10,L,6')
+
+  def test_walk_straight(self):
+    robot = VaccumRobot('99')
+    robot.view = {}
+    for y, line in enumerate(['..##.', '..#..', '..^..']):
+      for x, pixel in enumerate(line):
+        robot.view[(x,y)] = ord(pixel)
+    (robot.xsize, robot.ysize) = (5, 3)
+    (robot.xposition, robot.yposition) = (2, 2)
+    # starts straight ahead without a turn
+    self.assertEqual(robot.walk_path(), [2, 'R', 1])
+
+  def test_walk_loop(self):
+    robot = VaccumRobot('99')
+    robot.view = {}
+    for y, line in enumerate(['###', '#.#', '^##']):
+      for x, pixel in enumerate(line):
+        robot.view[(x,y)] = ord(pixel)
+    (robot.xsize, robot.ysize) = (3, 3)
+    (robot.xposition, robot.yposition) = (0, 2)
+    # one lap around a closed scaffold
+    self.assertEqual(robot.walk_path(), [2, 'R', 2, 'R', 2, 'R', 2])
+    self.assertEqual((robot.xposition, robot.yposition, robot.direction), (0, 2, '<'))
+
+
+from profiler import Profiler
+class TestProfiler(TestDay):
+  def test_counts(self):
+    # 2+3 into pos 0, jump over pos 7 to HALT
+    program = Program('1101,2,3,0,1105,1,8,99,99')
+    profiler = Profiler()
+    profiler.attach(program)
+    intcode(program)
+    profile = profiler.to_json()
+    self.assertEqual(profile['instructions'], 3)
+    self.assertEqual(profile['opcodes'], {'SUM': 1, 'JNZ': 1, 'HALT': 1})
+    self.assertEqual(profile['modes']['SUM 1,1,0'], 1)
+    self.assertEqual(profile['jumps'], {'4->8': 1})
+    self.assertEqual(profile['writes'], {'0': 1})
+    self.assertIn('intcode;SUM;0:1101 1', profiler.folded())
+
+  def test_suspended_input(self):
+    # an INP that suspends is counted once, when it runs
+    program = Program('3,100,4,100,1105,1,0')
+    profiler = Profiler()
+    profiler.attach(program)
+    self.assertEqual(program.run(1), [1])
+    self.assertEqual(program.run(2), [2])
+    profile = profiler.to_json()
+    self.assertEqual(profile['opcodes'], {'INP': 2, 'OUT': 2, 'JNZ': 2})
+    self.assertEqual(profile['writes'], {'100': 2})
+
+  def test_jit(self):
+    with open(f'{self.input_loc}/day9') as inp:
+      code = inp.read()
+    profiles = []
+    for jit in (False, True):
+      program = Program(code)
+      program.jit = jit
+      profiler = Profiler(heatmap=False)
+      profiler.attach(program)
+      self.assertEqual(program.run(1), [2870072642])
+      profile = profiler.to_json()
+      profiles.append((profile['opcodes'], profile['jumps']))
+      self.assertEqual(profile['reads'], {})
+    # compiled blocks are counted like interpreted instructions
+    self.assertEqual(profiles[0], profiles[1])